@@ -13,6 +13,7 @@ if (document.getElementById('cartogram-maker')) {
     mapTitle,
     geoUrl,
     csvUrl,
+    editedKey,
     mapTypes,
     cartoColorScheme,
     choroSettings
@@ -12,6 +12,7 @@ interface CartogramConfig {
   choroVersions?: Array<string>
   choroSpec?: any
   maxCartogram?: number
+  progressStream?: boolean
 }
 
 declare global {
@@ -0,0 +1,312 @@
+import asyncio
+import fcntl
+import math
+import os
+import threading
+import time
+import uuid
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager, contextmanager
+from typing import IO
+
+import redis_pool
+import settings
+from errors import CartoBusyError
+
+# Take a cluster slot unless all of them are held; expired slots are released first.
+# KEYS[1]: sorted set of slot holders scored by acquire time
+# ARGV[1]: lease in seconds, ARGV[2]: number of slots, ARGV[3]: holder token
+ACQUIRE_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - tonumber(ARGV[1]))
+if redis.call("ZCARD", KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call("ZADD", KEYS[1], now, ARGV[3])
+    redis.call("EXPIRE", KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+CLUSTER_KEY = "cartslots"
+
+#: Open lock file and marker file of a held lock, see _acquire_lock
+LockFiles = tuple[IO, IO]
+
+#: Counters of this process, see get_stats
+_stats = {"admitted": 0, "queued": 0, "rejected": 0, "wait_time": 0.0}
+#: Average number of seconds a slot is held, used for the retry-after hint
+_average_run_time = None
+_stats_lock = threading.Lock()
+
+
+@contextmanager
+def host_slot(poll_interval: float = 0.1) -> Generator[int | None, None, None]:
+    """
+    Hold one of the CARTOGRAM_HOST_WORKERS slots shared by all processes on this host,
+    and one of the CARTOGRAM_CLUSTER_WORKERS slots shared through Redis if enabled.
+
+    Each host slot is an exclusive lock on a file in CARTOGRAM_LOCK_DIR, so slots are
+    released by the operating system even if the holding process dies. When all slots
+    are taken, at most CARTOGRAM_HOST_QUEUE runs wait for one, for at most
+    CARTOGRAM_HOST_QUEUE_TIMEOUT seconds; other runs are rejected.
+
+    Args:
+        poll_interval: Seconds to wait before trying again when all slots are taken
+
+    Yields:
+        int | None: Index of the acquired host slot, or None if there is no host limit
+
+    Raises:
+        CartoBusyError: If the wait queue is full or the wait takes too long
+    """
+    if not settings.CARTOGRAM_HOST_WORKERS and not settings.CARTOGRAM_CLUSTER_WORKERS:
+        yield None
+        return
+
+    slot = _try_acquire()
+    if slot is None:
+        ticket = _enter_queue()
+        start = time.monotonic()
+        try:
+            while (slot := _try_acquire()) is None:
+                _check_wait_time(start)
+                time.sleep(poll_interval)
+        finally:
+            _leave_queue(ticket, start)
+
+    with _hold(slot) as index:
+        yield index
+
+
+@asynccontextmanager
+async def async_host_slot(
+    poll_interval: float = 0.1,
+) -> AsyncGenerator[int | None, None]:
+    """
+    Hold a host slot like host_slot, without blocking the event loop while waiting.
+
+    Args:
+        poll_interval: Seconds to wait before trying again when all slots are taken
+
+    Yields:
+        int | None: Index of the acquired host slot, or None if there is no host limit
+
+    Raises:
+        CartoBusyError: If the wait queue is full or the wait takes too long
+    """
+    if not settings.CARTOGRAM_HOST_WORKERS and not settings.CARTOGRAM_CLUSTER_WORKERS:
+        yield None
+        return
+
+    slot = _try_acquire()
+    if slot is None:
+        ticket = _enter_queue()
+        start = time.monotonic()
+        try:
+            while (slot := _try_acquire()) is None:
+                _check_wait_time(start)
+                await asyncio.sleep(poll_interval)
+        finally:
+            _leave_queue(ticket, start)
+
+    with _hold(slot) as index:
+        yield index
+
+
+def get_stats() -> dict:
+    """
+    Get the load of the host slots and the admission counters of this process.
+
+    Returns:
+        dict: workers, running and waiting runs on this host, cluster_running runs
+              if the cluster limit is enabled, and admitted, queued, rejected and
+              wait_time (seconds) counters of this process
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    stats["workers"] = settings.CARTOGRAM_HOST_WORKERS
+    stats["running"] = _count_locked("slot", settings.CARTOGRAM_HOST_WORKERS)
+    stats["waiting"] = _count_locked("queue", settings.CARTOGRAM_HOST_QUEUE)
+
+    if settings.CARTOGRAM_CLUSTER_WORKERS:
+        stats["cluster_workers"] = settings.CARTOGRAM_CLUSTER_WORKERS
+        stats["cluster_running"] = redis_pool.get_connection().zcard(CLUSTER_KEY)
+
+    return stats
+
+
+def get_retry_after() -> int:
+    """Estimate the number of seconds after which a rejected run may be admitted."""
+    if _average_run_time is None:
+        return 10
+
+    waiting = _count_locked("queue", settings.CARTOGRAM_HOST_QUEUE) + 1
+    workers = max(1, settings.CARTOGRAM_HOST_WORKERS)
+    return max(1, math.ceil(_average_run_time * waiting / workers))
+
+
+@contextmanager
+def _hold(
+    slot: tuple[int | None, LockFiles | None, str | None],
+) -> Generator[int | None, None, None]:
+    index, lock_file, token = slot
+    start = time.monotonic()
+
+    with _stats_lock:
+        _stats["admitted"] += 1
+
+    try:
+        yield index
+    finally:
+        if token is not None:
+            _release_cluster_slot(token)
+        if lock_file is not None:
+            _release_lock(lock_file)
+
+        _record_run_time(time.monotonic() - start)
+
+
+def _try_acquire() -> tuple[int | None, LockFiles | None, str | None] | None:
+    """
+    Try to take a host slot and a cluster slot.
+
+    Returns:
+        tuple | None: Host slot index and lock file (None without host limit) and
+                      cluster token (None without cluster limit), or None if busy
+    """
+    index, lock_file = None, None
+    if settings.CARTOGRAM_HOST_WORKERS:
+        lock = _acquire_lock("slot", settings.CARTOGRAM_HOST_WORKERS)
+        if lock is None:
+            return None
+        index, lock_file = lock
+
+    token = None
+    if settings.CARTOGRAM_CLUSTER_WORKERS:
+        token = _acquire_cluster_slot()
+        if token is None:
+            if lock_file is not None:
+                _release_lock(lock_file)
+            return None
+
+    return index, lock_file, token
+
+
+def _enter_queue() -> LockFiles | None:
+    """Take a place in the wait queue, or reject the run if the queue is full."""
+    if not settings.CARTOGRAM_HOST_QUEUE:
+        ticket = None
+    else:
+        lock = _acquire_lock("queue", settings.CARTOGRAM_HOST_QUEUE)
+        if lock is None:
+            _reject()
+        _, ticket = lock
+
+    with _stats_lock:
+        _stats["queued"] += 1
+
+    return ticket
+
+
+def _leave_queue(ticket: LockFiles | None, start: float) -> None:
+    if ticket is not None:
+        _release_lock(ticket)
+
+    with _stats_lock:
+        _stats["wait_time"] += time.monotonic() - start
+
+
+def _check_wait_time(start: float) -> None:
+    timeout = settings.CARTOGRAM_HOST_QUEUE_TIMEOUT
+    if timeout and time.monotonic() - start > timeout:
+        _reject()
+
+
+def _reject() -> None:
+    with _stats_lock:
+        _stats["rejected"] += 1
+
+    raise CartoBusyError(retry_after=get_retry_after())
+
+
+def _record_run_time(run_time: float) -> None:
+    global _average_run_time
+
+    with _stats_lock:
+        if _average_run_time is None:
+            _average_run_time = run_time
+        else:
+            # Exponential moving average, recent runs count the most
+            _average_run_time = 0.8 * _average_run_time + 0.2 * run_time
+
+
+def _acquire_lock(name: str, count: int) -> tuple[int, LockFiles] | None:
+    """
+    Try to lock one of `count` lock files, return its index and files, or None if all
+    are taken.
+
+    The holder also takes a shared lock on a marker file next to the lock file, which
+    _count_locked probes, so counting never makes a free lock file look taken.
+    """
+    os.makedirs(settings.CARTOGRAM_LOCK_DIR, exist_ok=True)
+
+    for index in range(count):
+        lock_path = os.path.join(settings.CARTOGRAM_LOCK_DIR, f"{name}-{index}.lock")
+        lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+
+        # Only _count_locked takes an exclusive lock on the marker, and only briefly
+        marker_file = open(_get_marker_path(name, index), "a")
+        fcntl.flock(marker_file, fcntl.LOCK_SH)
+        return index, (lock_file, marker_file)
+
+    return None
+
+
+def _release_lock(lock_files: LockFiles) -> None:
+    for lock_file in reversed(lock_files):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _get_marker_path(name: str, index: int) -> str:
+    return os.path.join(settings.CARTOGRAM_LOCK_DIR, f"{name}-{index}.held")
+
+
+def _count_locked(name: str, count: int) -> int:
+    """Count the lock files that are held by any process, by probing their markers."""
+    locked = 0
+    for index in range(count):
+        try:
+            with open(_get_marker_path(name, index), "a") as marker_file:
+                fcntl.flock(marker_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            locked += 1
+        except OSError:
+            pass
+
+    return locked
+
+
+def _acquire_cluster_slot() -> str | None:
+    token = uuid.uuid4().hex
+    acquire = redis_pool.get_connection().register_script(ACQUIRE_SCRIPT)
+    acquired = acquire(
+        keys=[CLUSTER_KEY],
+        args=[
+            settings.CARTOGRAM_CLUSTER_LEASE,
+            settings.CARTOGRAM_CLUSTER_WORKERS,
+            token,
+        ],
+    )
+    return token if acquired else None
+
+
+def _release_cluster_slot(token: str) -> None:
+    redis_pool.get_connection().zrem(CLUSTER_KEY, token)
@@ -1,9 +1,10 @@
 import os
 
 import numpy as np
+from carto.cache import CartoCache
 from carto.dataframe import CartoDataFrame
 from carto.datajson import CartoJson
-from carto.generators.cpp_wrapper import run_binary
+from carto.generators.cpp_wrapper import get_cache_key, run_binary
 from carto.mapcolor import assign_colors
 from carto.storage import CartoStorage
 from errors import CartoError
@@ -37,7 +38,11 @@ def preprocess(input, mapDBKey="temp_filename"):
         input.save(input_path)
 
     # Load the geographic data into a CartoDataFrame
-    cdf = CartoDataFrame.read_file(input_path)
+    # The file is hashed once for the validity and adjacency caches
+    file_hash = CartoCache.hash_file(input_path)
+    cdf = CartoDataFrame.read_file(input_path, file_hash=file_hash)
+    # The regions to color are read from the file, so their adjacency is cached by it
+    adjacency_key = CartoCache.make_key(file_hash, "adjacency")
 
     # Remove the original file if input is file object
     if not isinstance(input, str):
@@ -74,7 +79,7 @@ def preprocess(input, mapDBKey="temp_filename"):
         cdf["Geographic Area (sq. km)"] = cdf["Geographic Area (sq. km)"].astype(float)
 
     if "ColorGroup" not in cdf.columns:
-        cdf["ColorGroup"] = assign_colors(tmp_cdf)
+        cdf["ColorGroup"] = assign_colors(tmp_cdf, adjacency_key)
 
     if "cartogram_id" not in cdf.columns:
         cdf["cartogram_id"] = range(1, len(cdf) + 1)
@@ -171,6 +176,8 @@ def generate_equal_area(
     input_path: str,
     data_path: str | None = None,
     flags: list[str] = [],
+    geojson: dict | None = None,
+    usage: dict | None = None,
 ) -> CartoJson:
     """
     Generate an equal area projection of geographic data for cartogram creation.
@@ -186,13 +193,17 @@ def generate_equal_area(
         data_path: Optional path to additional data file for inset calculations
         equal_area_path: Optional output path to save the equal area projection
         flags: List of command-line flags to pass to the binary
+        geojson: GeoJSON data of the frame if it is already written to input_path with
+            to_carto_file
+        usage: Dictionary updated with the resources used by the binary, see run_binary
 
     Returns:
         CartoJson: Object containing the equal area projected geographic data
     """
 
     # Save the cartogram data frame to a GeoJSON file
-    geojson = cdf.to_carto_file(input_path)
+    if geojson is None:
+        geojson = cdf.to_carto_file(input_path)
     is_projected = cdf.is_projected
 
     if cdf.is_world:
@@ -220,13 +231,32 @@ def generate_equal_area(
             "Geographic Area (sq. km)",
         ]
 
+    # Reuse the post-processed result for the same boundary, insets and flags
+    # Only this result is cached, the raw output of the binary is not cached in "cpp"
+    cache = CartoCache("equal_area")
+    cache_key = None
+    if not cdf.is_projected or data_path:
+        cache_key = get_cache_key(input_path, data_path, "Geographic Area", flags)
+
+    cached_json = cache.get_json(cache_key) if cache_key else None
+    if cached_json is not None:
+        return CartoJson(cached_json, cdf.is_world)
+
     # Run the projection binary if data needs processing (case 1-3)
     equal_area_json = None
     if not cdf.is_projected or data_path:
-        equal_area_json = run_binary(input_path, data_path, "Geographic Area", flags)
+        equal_area_json = run_binary(
+            input_path,
+            data_path,
+            "Geographic Area",
+            flags,
+            cached=False,
+            usage=usage,
+        )
 
     # Handle projection failure by falling back to original data
-    if equal_area_json is None:
+    projected = equal_area_json is not None
+    if not projected:
         equal_area_json = geojson
         # TODO: warn the user about projection failure
 
@@ -234,4 +264,7 @@ def generate_equal_area(
     equal_area_json = CartoJson(equal_area_json, cdf.is_world)
     equal_area_json.postprocess()
 
+    if cache_key and projected:
+        cache.set_json(cache_key, equal_area_json.json_data)
+
     return equal_area_json
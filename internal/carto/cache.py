@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+from typing import ClassVar
+
+import settings
+from utils import file_utils
+
+
+class CartoCache:
+    """
+    A content-addressed file cache with size-based LRU eviction.
+
+    Entries are stored as files named by their key under CARTOGRAM_CACHE_DIR/<namespace>.
+    The modification time of an entry is refreshed on every hit, so the least recently
+    used entries are evicted first once the namespace grows beyond its size limit.
+
+    Attributes:
+        namespace (str): Name of the sub-directory holding the entries
+        max_size (int): Maximum total size of the entries in bytes (0 disables the cache)
+        cache_path (str): Path to the directory holding the entries
+    """
+
+    #: Hit and miss counters of each namespace in this process
+    counters: ClassVar[dict[str, dict[str, int]]] = {}
+    counters_lock = threading.Lock()
+
+    def __init__(self, namespace: str, max_size: int | None = None):
+        """
+        Initialize CartoCache for a namespace.
+
+        Args:
+            namespace (str): Name of the sub-directory holding the entries
+            max_size (int, optional): Maximum total size in bytes. Defaults to CARTOGRAM_CACHE_SIZE.
+        """
+        self.namespace = file_utils.sanitize_filename(namespace)
+        self.max_size = (
+            max_size if max_size is not None else settings.CARTOGRAM_CACHE_SIZE
+        )
+        self.cache_path = file_utils.get_safepath(
+            settings.CARTOGRAM_CACHE_DIR, self.namespace
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(*parts: str | bytes) -> str:
+        """
+        Build a cache key by hashing all parts in order.
+
+        Args:
+            *parts: Strings or bytes that identify the cached content
+
+        Returns:
+            str: Hex digest of the parts
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_file(filepath: str) -> str:
+        """
+        Hash the content of a file.
+
+        Args:
+            filepath (str): Path to the file
+
+        Returns:
+            str: Hex digest of the file content
+        """
+        digest = hashlib.sha256()
+        with open(file_utils.get_safepath(filepath), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Read an entry and mark it as recently used.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            bytes | None: Content of the entry, or None if it is not cached
+        """
+        if not self.enabled:
+            return None
+
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                data = f.read()
+            os.utime(entry_path)
+        except OSError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        """
+        Write an entry, then evict the least recently used entries if the cache is full.
+
+        Args:
+            key (str): Cache key
+            data (bytes): Content of the entry
+        """
+        if not self.enabled or len(data) > self.max_size:
+            return
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        entry_path = self._get_entry_path(key)
+
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+
+        self._evict()
+
+    def get_json(self, key: str):
+        """Read a JSON entry. Returns None if it is not cached."""
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def set_json(self, key: str, value) -> None:
+        """Write a JSON entry."""
+        if self.enabled:
+            self.set(key, json.dumps(value).encode())
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get hit and miss counters of this process, and the current size of the namespace.
+
+        Returns:
+            dict: hits, misses, entries, and size (in bytes)
+        """
+        entries = self._list_entries()
+        counters = self.counters.get(self.namespace, {})
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": len(entries),
+            "size": sum(size for _, _, size in entries),
+        }
+
+    def _get_entry_path(self, key: str) -> str:
+        return file_utils.get_safepath(self.cache_path, key)
+
+    def _count(self, counter: str) -> None:
+        with self.counters_lock:
+            counters = self.counters.setdefault(self.namespace, {})
+            counters[counter] = counters.get(counter, 0) + 1
+
+    def _list_entries(self) -> list[tuple[str, float, int]]:
+        entries = []
+        try:
+            with os.scandir(self.cache_path) as it:
+                for entry in it:
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            pass
+
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._list_entries()
+        total_size = sum(size for _, _, size in entries)
+        if total_size <= self.max_size:
+            return
+
+        # Remove the least recently used entries first
+        for path, _, size in sorted(entries, key=lambda entry: entry[1]):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            total_size = total_size - size
+            if total_size <= self.max_size:
+                break
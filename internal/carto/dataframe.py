@@ -2,8 +2,19 @@ import json
 from typing import Any
 
 import geopandas as gpd
+import numpy as np
+import shapely
+from carto.cache import CartoCache
 from errors import CartoError
-from utils import file_utils
+from utils import file_utils, geojson_utils, io_utils
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard json module is used without it
+    orjson = None
+
+#: Maximum number of invalid features listed in an error message
+MAX_LISTED_FEATURES = 10
 
 
 class CartoDataFrame(gpd.GeoDataFrame):
@@ -85,45 +96,67 @@ class CartoDataFrame(gpd.GeoDataFrame):
         return CartoDataFrame(result, extra_attributes=self.extra_attributes)
 
     @classmethod
-    def read_file(cls, filepath):
+    def read_file(cls, filepath, columns=None, trusted=False, file_hash=None):
+        """
+        Read a boundary file and preserve the extra attributes of GeoJSON.
+
+        Args:
+            filepath: Path to the file, in any format supported by GDAL
+            columns: Names of the attribute columns to read, or None to read all
+            trusted: Whether the file is known to be valid (e.g., a built-in map), so
+                its geometries are not checked
+            file_hash: Hash of the file content from CartoCache.hash_file, if the
+                caller has already computed it
+
+        Returns:
+            CartoDataFrame: The boundaries
+        """
         filepath = file_utils.get_safepath(filepath)
         extra_attributes = {}
 
-        # Reads a GeoJSON file and preserves extra attributes.
-        # If fail, just try again with GeoPandas only
+        # Reads the extra attributes of a GeoJSON file without parsing its features,
+        # which are only read by GeoPandas. If fail, just read with GeoPandas only
         if filepath.lower().endswith(".json") or filepath.lower().endswith(".geojson"):
-            encodings = ["utf-8", "utf-16", "latin-1", "iso-8859-1", "windows-1252"]
             try:
-                for encoding in encodings:
-                    with open(filepath, "r", encoding=encoding) as f:
-                        data = json.load(f)
-                        extra_attributes = {
-                            key: value
-                            for key, value in data.items()
-                            if key != "features"
-                        }
-                        break
-            except (UnicodeDecodeError, json.JSONDecodeError):
+                extra_attributes = geojson_utils.read_collection_members(filepath)
+            except (UnicodeDecodeError, ValueError):
                 pass
 
-        gdf = gpd.read_file(filepath)
+        gdf = io_utils.read_dataframe(filepath, columns)
 
         # Deal with topojson
         if gdf.crs is None:
             gdf.set_crs("EPSG:4326", inplace=True)
 
-        if not gdf.is_simple.all():
+        non_simple = (
+            [] if trusted else get_non_simple_features(gdf, filepath, file_hash)
+        )
+        if non_simple:
             if extra_attributes.get("type", "") == "Topology":
                 raise CartoError(
                     "TopoJSON is not fully supported. Please convert your file to GeoJSON and try again."
                 )
             else:
+                listed = ", ".join(map(str, non_simple[:MAX_LISTED_FEATURES]))
+                if len(non_simple) > MAX_LISTED_FEATURES:
+                    listed += ", ..."
                 raise CartoError(
-                    "Geometries are not simple. Fix the boundary file and try again."
+                    f"Geometries are not simple in {len(non_simple)} feature(s) "
+                    f"(at index {listed}). Fix the boundary file and try again."
                 )
 
         return cls(gdf, extra_attributes=extra_attributes)
 
+    @classmethod
+    def from_json_obj(cls, json_data: dict):
+        """Create from GeoJSON data in memory, preserving extra attributes like read_file."""
+        extra_attributes = {
+            key: value for key, value in json_data.items() if key != "features"
+        }
+        gdf = gpd.GeoDataFrame.from_features(json_data["features"], crs="EPSG:4326")
+
+        return cls(gdf, extra_attributes=extra_attributes)
+
     def to_crs(self, *args, **kwargs) -> Any:
         """
         Overrides GeoDataFrame's to_crs method.
@@ -145,13 +178,64 @@ class CartoDataFrame(gpd.GeoDataFrame):
         return {
             "type": "FeatureCollection",
             **self.extra_attributes,
-            "features": json.loads(super().to_json(*args, **kwargs))["features"],
+            "features": self._to_features(*args, **kwargs),
         }
 
+    def _to_features(self, *args, **kwargs):
+        geometries = self.geometry.values
+        type_ids = shapely.get_type_id(geometries)
+        is_polygon = (type_ids == shapely.GeometryType.POLYGON) | (
+            type_ids == shapely.GeometryType.MULTIPOLYGON
+        )
+        if not is_polygon.all() or shapely.is_empty(geometries).any():
+            return json.loads(super().to_json(*args, **kwargs))["features"]
+
+        # Convert the polygons through one coordinate buffer, and the properties
+        # without geometries, instead of writing GeoJSON text and parsing it back
+        geometry_type, coordinates, offsets = shapely.to_ragged_array(geometries)
+        if geometry_type == shapely.GeometryType.POLYGON:
+            # Treat each polygon as a MultiPolygon with one part
+            offsets = (*offsets, np.arange(len(geometries) + 1))
+
+        frame = gpd.GeoDataFrame(self, copy=False).set_geometry(
+            gpd.GeoSeries([None] * len(self), index=self.index, crs=self.crs)
+        )
+        if not all(isinstance(col, str) for col in frame.columns):
+            # Property names are strings, as json.dumps writes the keys of a dict
+            frame = frame.rename(
+                columns=lambda col: col if isinstance(col, str) else json.dumps(col)
+            )
+        features = gpd.GeoDataFrame.to_geo_dict(frame, *args, **kwargs)["features"]
+        geometry_types = np.where(
+            type_ids == shapely.GeometryType.POLYGON, "Polygon", "MultiPolygon"
+        ).tolist()
+        for feature, geometry in zip(
+            features,
+            geojson_utils.polygons_from_ragged_array(
+                coordinates, offsets, geometry_types
+            ),
+        ):
+            feature["geometry"] = geometry
+
+        return features
+
     def to_carto_file(self, filepath):
+        """
+        Write the GeoJSON input of the cartogram binary.
+
+        Args:
+            filepath: Path to the file
+
+        Returns:
+            dict: The GeoJSON data written to the file
+        """
         output_data = self.to_json_obj()
-        with open(file_utils.get_safepath(filepath), "w") as f:
-            json.dump(output_data, f)
+        if orjson is not None:
+            data = orjson.dumps(output_data, option=orjson.OPT_SERIALIZE_NUMPY)
+        else:
+            data = json.dumps(output_data).encode()
+
+        file_utils.write_atomic(file_utils.get_safepath(filepath), data)
         return output_data
 
     def clean_properties(
@@ -195,3 +279,33 @@ class CartoDataFrame(gpd.GeoDataFrame):
 
         if "label" in self.columns:
             self["label"] = self["label"].apply(json.loads)
+
+
+def get_non_simple_features(
+    gdf: gpd.GeoDataFrame, filepath: str, file_hash: str | None = None
+) -> list[int]:
+    """
+    Find the features of a boundary file whose geometries are missing or not simple,
+    reusing the result for a file with the same content if it is cached.
+
+    Args:
+        gdf: Features read from the file
+        filepath: Path to the file
+        file_hash: Hash of the file content, computed from the file if not given
+
+    Returns:
+        list[int]: Positions of the features in the file
+    """
+    cache = CartoCache("validity")
+    cache_key = None
+    if cache.enabled:
+        cache_key = file_hash or CartoCache.hash_file(filepath)
+    cached = cache.get_json(cache_key) if cache_key else None
+    if cached is not None:
+        return cached["non_simple"]
+
+    non_simple = np.flatnonzero(~gdf.is_simple.to_numpy()).tolist()
+    if cache_key:
+        cache.set_json(cache_key, {"non_simple": non_simple})
+
+    return non_simple
@@ -1,5 +1,8 @@
+import json
 import math
 
+import numpy as np
+import settings
 import shapely
 from utils import file_utils, geojson_utils
 
@@ -21,11 +24,27 @@ class CartoJson:
         """
         #: GeoJSON data
         self.json_data = json_data
+        geometries = [feature["geometry"] for feature in json_data["features"]]
+        #: GeoJSON types of the geometries, or None if they are not all polygons
+        self.geometry_types = None
+        #: Coordinates and their offsets in shapely's ragged array layout, if polygons
+        self.ragged_array = None
+        if all(
+            geometry is not None and geometry["type"] in ("Polygon", "MultiPolygon")
+            for geometry in geometries
+        ):
+            self.ragged_array = geojson_utils.polygons_to_ragged_array(geometries)
+
         #: Geometries created from GeoJSON data for processing
-        self.geometries = [
-            shapely.geometry.shape(feature["geometry"])
-            for feature in json_data["features"]
-        ]
+        if self.ragged_array is not None:
+            self.geometry_types = [geometry["type"] for geometry in geometries]
+            self.geometries = shapely.from_ragged_array(
+                shapely.GeometryType.MULTIPOLYGON, *self.ragged_array
+            )
+        else:
+            self.geometries = np.array(
+                [shapely.geometry.shape(geometry) for geometry in geometries]
+            )
         #: Geometries information including bounding box, centriod, and total area of geojson.
         self.geoms_info = geojson_utils.get_geoms_info(self.geometries)
 
@@ -117,24 +136,49 @@ class CartoJson:
             origin_x, origin_y (float): Origin point for scaling
             diff_x, diff_y (float): Translation offsets
         """
-        for index, feature in enumerate(self.json_data["features"]):
-            # Scale geometry around origin point
-            self.geometries[index] = shapely.affinity.scale(
-                self.geometries[index],
-                xfact=scale_factor,
-                yfact=scale_factor,
-                origin=(origin_x, origin_y),
-            )
+        transformation = self._get_transformation(
+            scale_factor, origin_x, origin_y, diff_x, diff_y
+        )
 
-            # Translate geometry to target position
-            self.geometries[index] = shapely.affinity.translate(
-                self.geometries[index],
-                xoff=diff_x,
-                yoff=diff_y,
+        if self.ragged_array is not None:
+            # Scale and translate all coordinates at once, then rebuild the geometries
+            coordinates, offsets = self.ragged_array
+            self.ragged_array = (transformation(coordinates), offsets)
+            self.geometries = shapely.from_ragged_array(
+                shapely.GeometryType.MULTIPOLYGON, *self.ragged_array
+            )
+            geometries = geojson_utils.polygons_from_ragged_array(
+                *self.ragged_array, self.geometry_types
             )
+        else:
+            self.geometries = shapely.transform(self.geometries, transformation)
+            geometries = [
+                shapely.geometry.mapping(geometry) for geometry in self.geometries
+            ]
+
+        # Update the GeoJSON geometries with transformed coordinates
+        for feature, geometry in zip(self.json_data["features"], geometries):
+            feature["geometry"] = geometry
 
-            # Update the GeoJSON geometry with transformed coordinates
-            feature["geometry"] = shapely.geometry.mapping(self.geometries[index])
+    def _get_transformation(
+        self,
+        scale_factor: float,
+        origin_x: float,
+        origin_y: float,
+        diff_x: float,
+        diff_y: float,
+    ):
+        """
+        Get a function that scales and translates an array of coordinates.
+
+        Args:
+            scale_factor (float): Factor to scale geometries
+            origin_x, origin_y (float): Origin point for scaling
+            diff_x, diff_y (float): Translation offsets
+        """
+        origin = np.array([origin_x, origin_y])
+        diff = np.array([diff_x, diff_y])
+        return lambda coords: (coords - origin) * scale_factor + origin + diff
 
     def _transform_dividers(
         self,
@@ -158,19 +202,10 @@ class CartoJson:
         # Transform dividers geometry
         dividers_geom = shapely.geometry.shape(self.json_data["dividers"]["geometry"])
 
-        # Scale around origin point
-        adjusted_dividers = shapely.affinity.scale(
+        # Scale around origin point and translate to target position
+        adjusted_dividers = shapely.transform(
             dividers_geom,
-            xfact=scale_factor,
-            yfact=scale_factor,
-            origin=(origin_x, origin_y),
-        )
-
-        # Translate to target position
-        adjusted_dividers = shapely.affinity.translate(
-            adjusted_dividers,
-            xoff=diff_x,
-            yoff=diff_y,
+            self._get_transformation(scale_factor, origin_x, origin_y, diff_x, diff_y),
         )
 
         # Update dividers geometry in JSON data
@@ -218,15 +253,17 @@ class CartoJson:
         This method calculates a suitable point within each geometry where
         labels can be positioned, typically used for map labeling.
         """
-        for index, feature in enumerate(self.json_data["features"]):
-            # Get a representative point that's guaranteed to be inside the geometry
-            point = self.geometries[index].representative_point()
+        # Get representative points that are guaranteed to be inside the geometries
+        points = shapely.point_on_surface(self.geometries)
+        xs = shapely.get_x(points).tolist()
+        ys = shapely.get_y(points).tolist()
 
+        for feature, x, y in zip(self.json_data["features"], xs, ys):
             # Add label position to feature properties
             if "properties" not in feature:
                 feature["properties"] = {}
 
-            feature["properties"]["label"] = {"x": point.x, "y": point.y}
+            feature["properties"]["label"] = {"x": x, "y": y}
 
     def _fix_dividers_format(self):
         """
@@ -240,6 +277,62 @@ class CartoJson:
         ):
             self.json_data["dividers"] = [self.json_data["dividers"]]
 
+    def quantize(self, quantization: int) -> dict:
+        """
+        Get a copy of the GeoJSON data with coordinates rounded to the map extent.
+
+        Coordinates are rounded to the fewest decimal places that keep at least
+        `quantization` grid steps across the larger side of the bounding box, so the
+        positional error is at most half a step per axis. Features are copied, the
+        GeoJSON data of this object is left unchanged.
+
+        Args:
+            quantization (int): Minimum number of grid steps across the map extent
+
+        Returns:
+            dict: The GeoJSON data with rounded coordinates
+        """
+        ndigits = geojson_utils.get_quantized_precision(
+            self.geoms_info["bbox"], quantization
+        )
+
+        features = []
+        for feature in self.json_data["features"]:
+            feature = {
+                **feature,
+                "geometry": geojson_utils.round_geometry(feature["geometry"], ndigits),
+            }
+
+            label = feature.get("properties", {}).get("label")
+            if isinstance(label, dict):
+                feature["properties"] = {
+                    **feature["properties"],
+                    "label": {
+                        key: round(value, ndigits) for key, value in label.items()
+                    },
+                }
+
+            features.append(feature)
+
+        json_data = {**self.json_data, "features": features}
+
+        # Dividers may be a single object if the data is not post-processed
+        dividers = self.json_data.get("dividers")
+        if isinstance(dividers, dict):
+            json_data["dividers"] = self._quantize_divider(dividers, ndigits)
+        elif isinstance(dividers, list):
+            json_data["dividers"] = [
+                self._quantize_divider(divider, ndigits) for divider in dividers
+            ]
+
+        return json_data
+
+    def _quantize_divider(self, divider: dict, ndigits: int) -> dict:
+        return {
+            **divider,
+            "geometry": geojson_utils.round_geometry(divider["geometry"], ndigits),
+        }
+
     def save(self, project_path: str, filename: str, is_projected: bool = False) -> str:
         """
         Save the processed GeoJSON data to a file.
@@ -252,11 +345,18 @@ class CartoJson:
         Returns:
             str: File path where the GeoJson is saved
         """
-        import json
-
         filepath = file_utils.get_safepath(project_path, filename)
 
-        with open(filepath, "w") as f:
-            json.dump(self.json_data, f)
+        json_data = self.json_data
+        if settings.CARTOGRAM_QUANTIZATION:
+            json_data = self.quantize(settings.CARTOGRAM_QUANTIZATION)
+
+        data = json.dumps(json_data).encode()
+
+        # Replace instead of overwrite, the file may be linked to a built-in cartogram
+        file_utils.write_atomic(filepath, data)
+
+        if settings.CARTOGRAM_PRECOMPRESS:
+            file_utils.save_compressed(filepath, data)
 
         return filepath
@@ -0,0 +1,179 @@
+import json
+import os
+
+import settings
+from carto.cache import CartoCache
+from carto.datacsv import CartoCsv
+from carto.generators.cpp_wrapper import get_binary_id
+from utils import file_utils
+
+MANIFEST_FILENAME = "fingerprints.json"
+
+
+def get_fingerprints(
+    input_file: str,
+    datacsv: CartoCsv,
+    vis_types: dict,
+    clean_by: str | None,
+    flags: list[str],
+) -> dict[str, str]:
+    """
+    Fingerprint everything each output of a project is generated from.
+
+    The equal area map ("Geographic Area") depends on the cartogram binary, the
+    boundary file, the regions, insets and geographic areas of the csv, and the flags.
+    Each cartogram additionally depends on its visualization type and the values of
+    its column.
+
+    Args:
+        input_file: Path to the boundary file
+        datacsv: Processed data of the project
+        vis_types: Visualization types of the data columns
+        clean_by: Column of the boundary file holding the region names
+        flags: Flags passed to the cartogram binary
+
+    Returns:
+        dict: Fingerprint of each output by data name
+    """
+    key_cols = [
+        col
+        for col in datacsv.df.columns
+        if col in ("Region", "Inset") or col.startswith("Geographic Area")
+    ]
+    try:
+        binary_id = get_binary_id()
+    except OSError:
+        binary_id = ""
+
+    boundary_fingerprint = CartoCache.make_key(
+        binary_id,
+        CartoCache.hash_file(input_file),
+        datacsv.df[key_cols].to_csv(index=False),
+        json.dumps(datacsv.map_regions_dict, sort_keys=True),
+        clean_by or "",
+        json.dumps(flags),
+        str(settings.CARTOGRAM_QUANTIZATION),
+    )
+
+    fingerprints = {"Geographic Area": boundary_fingerprint}
+    for data_col in datacsv.data_cols:
+        vis_type = vis_types.get(data_col)
+        if vis_type not in ("contiguous", "noncontiguous"):
+            continue
+
+        fingerprints[datacsv.data_names.get(data_col, "Data")] = CartoCache.make_key(
+            boundary_fingerprint,
+            vis_type,
+            data_col,
+            datacsv.df[["Region", data_col]].to_csv(index=False),
+        )
+
+    return fingerprints
+
+
+def load(project_path: str) -> dict:
+    """
+    Read the fingerprint manifest of a project.
+
+    Args:
+        project_path: Directory of the project
+
+    Returns:
+        dict: The manifest, or an empty manifest if the project has none
+    """
+    try:
+        with open(file_utils.get_safepath(project_path, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"outputs": {}}
+
+    if not isinstance(manifest.get("outputs"), dict):
+        return {"outputs": {}}
+
+    return manifest
+
+
+def save(project_path: str, outputs: dict[str, dict], bbox: list[float]) -> None:
+    """
+    Write the fingerprint manifest of a project.
+
+    Args:
+        project_path: Directory of the project
+        outputs: For each data name, its fingerprint, bbox (of the output alone),
+            warnings and files
+        bbox: Bounding box shared by all outputs
+    """
+    data = json.dumps({"bbox": bbox, "outputs": outputs}).encode()
+    file_utils.write_atomic(
+        file_utils.get_safepath(project_path, MANIFEST_FILENAME), data
+    )
+
+
+def reuse(
+    source_path: str, project_path: str, fingerprints: dict[str, str]
+) -> dict[str, dict]:
+    """
+    Link the outputs of a source project whose fingerprints are unchanged into a project.
+
+    Args:
+        source_path: Directory of the project being edited
+        project_path: Directory of the new project
+        fingerprints: Fingerprints of the new project, see get_fingerprints
+
+    Returns:
+        dict: Manifest entries of the linked outputs by data name
+    """
+    source_path = file_utils.get_safepath(source_path)
+    if source_path == file_utils.get_safepath(project_path):
+        return {}
+
+    source_outputs = load(source_path)["outputs"]
+
+    reused = {}
+    for data_name, fingerprint in fingerprints.items():
+        entry = source_outputs.get(data_name)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            continue
+
+        files = entry.get("files", [])
+        sources = [file_utils.get_safepath(source_path, name) for name in files]
+        if not files or not all(os.path.exists(source) for source in sources):
+            continue
+
+        for name, source in zip(files, sources):
+            destination = file_utils.get_safepath(project_path, name)
+            file_utils.link_or_copy(
+                source, destination, compressed=settings.CARTOGRAM_PRECOMPRESS
+            )
+
+        reused[data_name] = entry
+
+    return reused
+
+
+def set_bbox(project_path: str, filename: str, bbox: list[float]) -> None:
+    """
+    Update the shared bounding box of a linked output if it has changed.
+
+    Args:
+        project_path: Directory of the project
+        filename: File name of the output
+        bbox: Bounding box shared by all outputs
+    """
+    filepath = file_utils.get_safepath(project_path, filename)
+    with open(filepath) as f:
+        json_data = json.load(f)
+
+    if json_data.get("bbox") == bbox:
+        return
+
+    json_data["bbox"] = bbox
+    data = json.dumps(json_data).encode()
+    file_utils.write_atomic(filepath, data)
+
+    for suffix in file_utils.COMPRESSED_SUFFIXES.values():
+        if os.path.exists(filepath + suffix):
+            os.remove(filepath + suffix)
+
+    if settings.CARTOGRAM_PRECOMPRESS:
+        file_utils.save_compressed(filepath, data)
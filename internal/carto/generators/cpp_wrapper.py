@@ -1,23 +1,46 @@
+import asyncio
+import csv
 import json
+import logging
 import os
+import resource
+import selectors
+import signal
 import subprocess
-import threading
+import time
+from collections.abc import AsyncGenerator, Generator
 from pathlib import Path
-from queue import Queue
-from typing import IO, Generator
 
 import settings
+from carto import limits
+from carto.admission import async_host_slot, host_slot
+from carto.cache import CartoCache
 from carto.progress import CartoProgress
 from errors import CartoError
 from utils import file_utils
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard json module is used without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+#: Maximum number of bytes read from the binary's output at a time
+READ_CHUNK_SIZE = 1 << 16
+
+#: Columns of the area data file that may affect the binary output besides the data column
+RELEVANT_CSV_COLUMNS = ["Region", "RegionLabel", "Color", "ColorGroup", "Inset"]
+
 
 def run_binary(
     gen_path: str,
     area_data_path: str | None,
     data_name: str = "",
-    flags: list[str] = [],
+    flags: list[str] | None = None,
     progress: CartoProgress | None = None,
+    cached: bool = True,
+    usage: dict | None = None,
 ) -> dict | None:
     """
     Run cartogram-cpp binary and track the progress.
@@ -28,6 +51,9 @@ def run_binary(
         data_name: Human-readable name for the data column
         flags: List of command-line flags to pass to the cartogram executable
         progress: Progress object to display generation progress
+        cached: Whether the output is cached, False if the caller caches its result
+        usage: Dictionary updated with the resources used by the binary (see
+            limits.get_usage), left unchanged if the output is cached
 
     Returns:
         dict: JSON-parsed output from cartogram generation, or None if no output
@@ -36,98 +62,430 @@ def run_binary(
         CartoError: If an error occurs during cartogram generation
     """
 
-    # Initialize output capture variables
-    stdout = ""
-    stderr = f"Process {data_name} ****************\n"
-    warning_msg_array = []
-    error_msg = ""
-    last_factor = None
-    last_geo_div = ""
-    order = 0  # Counter for progress update ordering
-
-    # Run the cartogram binary and process its output line by line
-    for source, line in execute(gen_path, area_data_path, flags):
+    flags = flags or []
+
+    # Reuse the result of an identical run if it is cached
+    cache = CartoCache("cpp")
+    cache_key = (
+        get_cache_key(gen_path, area_data_path, data_name, flags) if cached else None
+    )
+    cached_output = cache.get_json(cache_key) if cache_key else None
+    if cached_output is not None:
+        if progress:
+            progress.set("", data_name, 1)
+        return cached_output
+
+    output = BinaryOutput(data_name)
+
+    # Run the cartogram binary and process its output
+    for source, data in execute(gen_path, area_data_path, flags):
         if source == "stdout":
-            # Accumulate standard output (contains JSON result)
-            stdout += line.decode()
+            output.add_stdout(data)
+        elif source == "usage":
+            output.add_usage(data)
         else:
-            # Process stderr for progress updates and error messages
-            line_str = line.decode()
-            line_arr = line_str.split(":")
-            stderr += line_str
+            value = output.add_stderr(data)
+            if value is not None and progress:
+                # Update progress in database/tracking system
+                progress.set(output.stderr, data_name, value)
 
-            try:
-                match line_arr[0]:
-                    case "Progress":
-                        # Update progress in database/tracking system
-                        if progress:
-                            progress.set(order, stderr, data_name, float(line_arr[1]))
+    if usage is not None and output.usage is not None:
+        usage.update(output.usage)
+
+    json_output = output.result()
+
+    if cache_key and json_output is not None:
+        cache.set_json(cache_key, json_output)
+
+    return json_output
+
+
+async def run_binary_async(
+    gen_path: str,
+    area_data_path: str | None,
+    data_name: str = "",
+    flags: list[str] | None = None,
+    progress: CartoProgress | None = None,
+    usage: dict | None = None,
+) -> dict | None:
+    """
+    Run cartogram-cpp binary and track the progress, without blocking the event loop.
 
-                        order += 1  # Increment order counter for next progress update
+    Same as run_binary. Cancelling the task terminates the binary.
 
-                    case "Max. area err":
-                        # Max. area err: 0.00994953, GeoDiv: New Hampshire
-                        last_factor = float(line_arr[1].replace(", GeoDiv", ""))
-                        last_geo_div = line_arr[2]
+    Args:
+        gen_path: Path to the boundary/geometry file for cartogram generation
+        area_data_path: Path to the area data file containing population/data values
+        data_name: Human-readable name for the data column
+        flags: List of command-line flags to pass to the cartogram executable
+        progress: Progress object to display generation progress
+        usage: Dictionary updated with the resources used by the binary (see
+            limits.get_usage), left unchanged if the output is cached
 
-                    case "WARNING":
-                        warning_msg = line_arr[1].strip()
+    Returns:
+        dict: JSON-parsed output from cartogram generation, or None if no output
 
-                        if (
-                            warning_msg
-                            != "`projected=true` property detected. Applying --skip_projection flag."
-                        ):
-                            warning_msg_array.append(data_name + ": " + warning_msg)
+    Raises:
+        CartoError: If an error occurs during cartogram generation
+    """
+    flags = flags or []
+    cache = CartoCache("cpp")
+    cache_key = get_cache_key(gen_path, area_data_path, data_name, flags)
+    cached_output = cache.get_json(cache_key) if cache_key else None
+    if cached_output is not None:
+        if progress:
+            progress.set("", data_name, 1)
+        return cached_output
 
-                    case "ERROR":
-                        error_msg = line_arr[1].strip()
+    run = AsyncBinaryRun(gen_path, area_data_path, data_name, flags)
+    async for value in run:
+        if progress:
+            progress.set(run.output.stderr, data_name, value)
 
-                    case _:
-                        pass
+    if usage is not None and run.output.usage is not None:
+        usage.update(run.output.usage)
 
-            except:  # noqa: E722
-                pass
+    if cache_key and run.result is not None:
+        cache.set_json(cache_key, run.result)
 
-    # Handle processing results
-    if error_msg != "":
-        raise CartoError(error_msg)
-    elif stdout == "":
-        return None
+    return run.result
 
-    # Parse and return JSON output from successful cartogram generation
-    json_output = json.loads(stdout)
 
-    if warning_msg_array:
-        if last_factor is not None and last_factor > 0.01:
-            last_factor = round(last_factor * 100, 2)
-            warning_msg_array.append(
-                f"{data_name}: The resulting cartogram contains areas that deviate from their ideal size. \
-                    {last_geo_div} is the most distorted, appearing at {last_factor}% of its expected area."
+class AsyncBinaryRun:
+    """
+    A run of the cartogram binary driven by asyncio.
+
+    Iterating over the run starts the binary and yields its progress (0 to 1) as it
+    is reported. The parsed output is available as `result` after the iteration.
+    Cancelling the iteration, or stopping it early, terminates the binary.
+
+    Example:
+        run = AsyncBinaryRun(gen_path, area_data_path, data_name, flags)
+        async for value in run:
+            ...
+        json_output = run.result
+    """
+
+    def __init__(
+        self,
+        gen_path: str,
+        area_data_path: str | None,
+        data_name: str = "",
+        flags: list[str] | None = None,
+        timeout: float = 300,
+    ):
+        self.args = get_binary_args(gen_path, area_data_path, flags)
+        self.timeout = timeout
+        #: Collected output of the binary
+        self.output = BinaryOutput(data_name)
+        #: JSON-parsed output, set when the run is finished
+        self.result = None
+
+    async def __aiter__(self) -> AsyncGenerator[float, None]:
+        loop = asyncio.get_running_loop()
+
+        # Wait for a free slot so the host is not overloaded by concurrent binaries
+        async with async_host_slot():
+            process = await asyncio.create_subprocess_exec(
+                *self.args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                process_group=0,
             )
+            limits.apply_limits(process.pid)
+            stdout_task = asyncio.create_task(self._read_stdout(process.stdout))
+            usage = None
+
+            try:
+                # Stop the process if it takes longer than the timeout
+                deadline = loop.time() + self.timeout
+                stopping = False
+                while True:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = max(deadline - loop.time(), 0)
+
+                    try:
+                        line = await asyncio.wait_for(
+                            process.stderr.readline(), remaining
+                        )
+                    except TimeoutError:
+                        # Terminate the process, then kill it after the grace period,
+                        # and read the rest of its output
+                        if stopping:
+                            limits.signal_group(process.pid, signal.SIGKILL)
+                            deadline = None
+                        else:
+                            limits.signal_group(process.pid, signal.SIGTERM)
+                            deadline = loop.time() + settings.CARTOGRAM_KILL_GRACE
+                            stopping = True
+                        continue
+
+                    if not line:
+                        break
+
+                    # asyncio reaps the process, so its usage is read while it runs
+                    usage = limits.read_usage(process.pid) or usage
+
+                    value = self.output.add_stderr(line)
+                    if value is not None:
+                        yield value
+
+                await stdout_task
+                await process.wait()
+            finally:
+                stdout_task.cancel()
+                if process.returncode is None:
+                    await _stop_process(process)
+
+        if usage is not None:
+            self.output.add_usage(usage)
+
+        self.result = self.output.result()
+
+    async def _read_stdout(self, stream: asyncio.StreamReader) -> None:
+        while data := await stream.read(READ_CHUNK_SIZE):
+            self.output.add_stdout(data)
+
+
+async def _stop_process(process: asyncio.subprocess.Process) -> None:
+    """
+    Terminate the process group of a binary, and kill it if the binary does not exit
+    within CARTOGRAM_KILL_GRACE seconds.
+    """
+    limits.signal_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), settings.CARTOGRAM_KILL_GRACE)
+    except TimeoutError:
+        limits.signal_group(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+class BinaryOutput:
+    """
+    Output of a cartogram binary run, parsed as it is read.
+
+    stderr is parsed line by line for progress, warnings and errors; stdout is kept
+    as bytes in a growable buffer and parsed as JSON without decoding at the end.
+    """
+
+    def __init__(self, data_name: str = ""):
+        self.data_name = data_name
+        self.stdout = bytearray()
+        self.stderr = f"Process {data_name} ****************\n"
+        self.warning_msg_array = []
+        self.error_msg = ""
+        self.last_factor = None
+        self.last_geo_div = ""
+        #: Resources used by the binary, see limits.get_usage
+        self.usage = None
+
+    def add_stdout(self, data: bytes) -> None:
+        # Accumulate standard output (contains JSON result)
+        self.stdout += data
+
+    def add_usage(self, usage: dict[str, float]) -> None:
+        self.usage = usage
+        logger.info(
+            "Binary run for %s used %.1f s of CPU time, peak memory %.1f MB",
+            self.data_name,
+            usage["cpu_time"],
+            usage["max_rss"] / 1e6,
+        )
+
+    def add_stderr(self, line: bytes) -> float | None:
+        """
+        Process a line of stderr for progress updates and error messages.
+
+        Returns:
+            float | None: The progress if the line reports it
+        """
+        line_str = line.decode()
+        line_arr = line_str.split(":")
+        self.stderr += line_str
+
+        try:
+            match line_arr[0]:
+                case "Progress":
+                    return float(line_arr[1])
+
+                case "Max. area err":
+                    # Max. area err: 0.00994953, GeoDiv: New Hampshire
+                    self.last_factor = float(line_arr[1].replace(", GeoDiv", ""))
+                    self.last_geo_div = line_arr[2]
+
+                case "WARNING":
+                    warning_msg = line_arr[1].strip()
+
+                    if (
+                        warning_msg
+                        != "`projected=true` property detected. Applying --skip_projection flag."
+                    ):
+                        self.warning_msg_array.append(
+                            self.data_name + ": " + warning_msg
+                        )
+
+                case "ERROR":
+                    self.error_msg = line_arr[1].strip()
+
+                case _:
+                    pass
+
+        except:  # noqa: E722
+            pass
+
+        return None
 
-        json_output["Warnings"] = warning_msg_array
+    def result(self) -> dict | None:
+        """
+        Get the JSON-parsed output of the run.
 
+        Returns:
+            dict | None: The output with warnings, or None if there is no output
+
+        Raises:
+            CartoError: If the binary reported an error
+        """
+        # Handle processing results
+        if self.error_msg != "":
+            raise CartoError(self.error_msg)
+        elif not self.stdout.strip():
+            return None
+
+        # Parse and return JSON output from successful cartogram generation
+        json_output = parse_output(self.stdout, self.data_name)
+        self.stdout = bytearray()
+
+        warning_msg_array = self.warning_msg_array
+        if warning_msg_array:
+            last_factor = self.last_factor
+            if last_factor is not None and last_factor > 0.01:
+                last_factor = round(last_factor * 100, 2)
+                warning_msg_array.append(
+                    f"{self.data_name}: The resulting cartogram contains areas that deviate from their ideal size. \
+                    {self.last_geo_div} is the most distorted, appearing at {last_factor}% of its expected area."
+                )
+
+            json_output["Warnings"] = warning_msg_array
+
+        return json_output
+
+
+def parse_output(stdout: bytes | bytearray, data_name: str = "") -> dict:
+    """
+    Parse the JSON output of the binary, and log its size, the parse time, and the
+    peak memory usage of this process since it started. The peak is over the lifetime
+    of the worker, not this parse; the peak of each binary run is logged separately
+    from its own usage (see BinaryOutput.add_usage).
+
+    Args:
+        stdout: Standard output of the binary
+        data_name: Human-readable name for the data column (used in the log)
+
+    Returns:
+        dict: JSON-parsed output
+    """
+    start = time.perf_counter()
+    if orjson is not None:
+        json_output = orjson.loads(stdout)
+    else:
+        json_output = json.loads(stdout)
+
+    logger.info(
+        "Parsed %.1f MB of output for %s in %.2f s, worker lifetime peak memory %.1f MB",
+        len(stdout) / 1e6,
+        data_name,
+        time.perf_counter() - start,
+        # ru_maxrss is in kilobytes on Linux
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3,
+    )
     return json_output
 
 
-def execute(
-    input_path: str, area_data_path: str | None, custom_flags: list[str] = []
-) -> Generator[tuple[str, bytes], None, None]:
+def get_cache_key(
+    gen_path: str, area_data_path: str | None, data_name: str, flags: list[str]
+) -> str | None:
     """
-    Execute the cartogram binary with specified parameters and stream its output.
+    Build the cache key of a binary run from everything that affects its output.
+
+    The key covers the binary itself, the boundary file, the csv columns read by the
+    binary (region, metadata and the --area column), and the validated flags.
 
     Args:
-        input_path: Path to the boundary/geometry file
+        gen_path: Path to the boundary/geometry file
         area_data_path: Path to the area data file (can be None)
-        custom_flags: List of additional command-line flags for the executable
+        data_name: Human-readable name for the data column (used in warnings)
+        flags: List of command-line flags to pass to the cartogram executable
 
-    Yields:
-        tuple: (source, line) where source is "stdout" or "stderr" and line is bytes
+    Returns:
+        str | None: The cache key, or None if the run should not be cached
+    """
+    if not CartoCache("cpp").enabled:
+        return None
+
+    validate_options(flags)
+
+    try:
+        binary_id = get_binary_id()
+        gen_hash = CartoCache.hash_file(gen_path)
+    except (OSError, CartoError):
+        return None
+
+    csv_hash = ""
+    if area_data_path is not None:
+        area_col = flags[flags.index("--area") + 1] if "--area" in flags else None
+        try:
+            with open(file_utils.get_safepath(area_data_path), newline="") as f:
+                rows = list(csv.reader(f))
+        except (OSError, CartoError):
+            return None
+
+        if rows and area_col is not None:
+            header = rows[0]
+            relevant = [
+                index
+                for index, col in enumerate(header)
+                if index == 0
+                or col == area_col
+                or col in RELEVANT_CSV_COLUMNS
+                or col.startswith("Geographic Area")
+            ]
+            rows = [[row[i] if i < len(row) else "" for i in relevant] for row in rows]
+
+        csv_hash = CartoCache.make_key(json.dumps(rows))
+
+    return CartoCache.make_key(
+        binary_id,
+        gen_hash,
+        csv_hash,
+        data_name,
+        json.dumps(flags),
+        settings.CARTOGRAM_TIME_LIMIT or "",
+    )
+
+
+def get_binary_id() -> str:
+    """
+    Identify the installed cartogram executable, which changes when it is updated.
+
+    Returns:
+        str: Size and modification time of the executable
 
     Raises:
-        CartoError: If the boundary file path is invalid
+        OSError: If the executable does not exist
+    """
+    binary_stat = os.stat(get_binary_path())
+    return f"{binary_stat.st_size}:{binary_stat.st_mtime_ns}"
+
+
+def get_binary_path() -> str:
+    """
+    Get the path of the cartogram executable for this platform.
+
+    Returns:
+        str: Path to the executable
     """
-    # Construct path to the cartogram executable
     uname = os.uname()
     system = uname.sysname.lower()
     machine = uname.machine.lower()
@@ -136,9 +494,92 @@ def execute(
         binary_name = "cartogram-linux-arm64"
 
     current_file = Path(__file__).resolve()
-    cartogram_path = current_file.parent.parent.parent / "executable" / binary_name
+    return str(current_file.parent.parent.parent / "executable" / binary_name)
+
+
+def execute(
+    input_path: str, area_data_path: str | None, custom_flags: list[str] | None = None
+) -> Generator[tuple[str, bytes | dict], None, None]:
+    """
+    Execute the cartogram binary with specified parameters and stream its output.
+
+    Args:
+        input_path: Path to the boundary/geometry file
+        area_data_path: Path to the area data file (can be None)
+        custom_flags: List of additional command-line flags for the executable
+
+    Yields:
+        tuple: (source, data) where source is "stdout", "stderr" or "usage"; data is
+               a chunk of stdout or a line of stderr as bytes, or at the end, the
+               resources used by the binary (see limits.get_usage)
+
+    Raises:
+        CartoError: If the boundary file path is invalid
+    """
+    args = get_binary_args(input_path, area_data_path, custom_flags)
+
+    # Wait for a free slot so the host is not overloaded by concurrent binaries
+    with host_slot():
+        # Start the cartogram process in its own process group, so the whole group
+        # can be stopped, with pipes for communication
+        cartogram_process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            process_group=0,
+        )
+        limits.apply_limits(cartogram_process.pid)
+
+        finished = False
+        try:
+            # Stop the process if it takes more than 300 seconds
+            yield from read_output(cartogram_process, timeout=300)
+            finished = True
+        finally:
+            # Stop the process if the output is no longer read
+            # (poll() is not used, it would reap the process before its usage is read)
+            if not finished:
+                limits.signal_group(cartogram_process.pid, signal.SIGTERM)
+
+            for pipe in (
+                cartogram_process.stdin,
+                cartogram_process.stdout,
+                cartogram_process.stderr,
+            ):
+                pipe.close()
+
+            # Always reap the process
+            usage = limits.wait_process(
+                cartogram_process, settings.CARTOGRAM_KILL_GRACE
+            )
+
+        if usage is not None:
+            yield "usage", usage
+
+
+def get_binary_args(
+    input_path: str, area_data_path: str | None, custom_flags: list[str] | None = None
+) -> list[str]:
+    """
+    Build the command line of the cartogram binary.
+
+    Args:
+        input_path: Path to the boundary/geometry file
+        area_data_path: Path to the area data file (can be None)
+        custom_flags: List of additional command-line flags for the executable
+
+    Returns:
+        list[str]: The executable and its arguments
+
+    Raises:
+        CartoError: If the flags or the boundary file path are invalid
+    """
+    # Construct path to the cartogram executable
+    cartogram_path = get_binary_path()
 
     # Validate the custom flags before proceeding
+    custom_flags = custom_flags or []
     validate_options(custom_flags)
 
     # Sanitize and validate the geometry file path
@@ -148,7 +589,7 @@ def execute(
 
     # Build command line arguments
     args = [
-        str(cartogram_path),
+        cartogram_path,
         input_path,
         "--redirect_exports_to_stdout",
     ] + custom_flags
@@ -162,58 +603,68 @@ def execute(
     if os.path.isfile(area_data_path):
         args.append(area_data_path)
 
-    # Start the cartogram process with pipes for communication
-    cartogram_process = subprocess.Popen(
-        args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-
-    # Set up threaded readers for stdout and stderr to prevent blocking
-    q = Queue()
-    threading.Thread(
-        target=reader, args=[cartogram_process.stdout, "stdout", q]
-    ).start()
-    threading.Thread(
-        target=reader, args=[cartogram_process.stderr, "stderr", q]
-    ).start()
+    return args
 
-    # Set up a 300-second timeout to prevent hanging processes
-    timer = threading.Timer(300, cartogram_process.terminate)
-    timer.start()
 
-    try:
-        # Read from both stdout and stderr streams until both threads finish
-        # The range(2) accounts for the two reader threads
-        for _ in range(2):
-            for source, line in iter(q.get, None):
-                yield source, line
-    finally:
-        # Ensure timer is cancelled to prevent resource leaks
-        timer.cancel()
-
-
-def reader(
-    pipe: IO[bytes], pipe_name: str, queue: Queue[tuple[str, bytes] | None]
-) -> None:
+def read_output(
+    process: subprocess.Popen, timeout: float
+) -> Generator[tuple[str, bytes], None, None]:
     """
-    Thread worker function to read from a pipe and put lines into a queue.
+    Read stdout and stderr of a process in one thread until both are closed.
 
-    This function runs in a separate thread to prevent blocking when reading
-    from subprocess stdout/stderr pipes.
+    stdout is yielded in large chunks as it arrives. stderr is split into lines, as
+    it is parsed line by line for progress updates. The process is terminated if it
+    is still running after the timeout, and the rest of its output is read.
 
     Args:
-        pipe: The pipe object (stdout or stderr) to read from
-        pipe_name: String identifier ("stdout" or "stderr") for the pipe
-        queue: Queue object to put the read lines into
+        process: The process started with stdout and stderr pipes
+        timeout: Number of seconds before the process is terminated
+
+    Yields:
+        tuple: (source, data) where source is "stdout" or "stderr"; data is a chunk
+               of stdout or a line of stderr
     """
-    try:
-        # Read lines from the pipe until EOF
-        with pipe:
-            for line in iter(pipe.readline, b""):
-                # Put each line into the queue with its source identifier
-                queue.put((pipe_name, line))
-    finally:
-        # Signal completion by putting None into the queue
-        queue.put(None)
+    deadline = time.monotonic() + timeout
+    stopping = False
+    stderr_buffer = b""
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+
+        while selector.get_map():
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+                if remaining == 0:
+                    # Terminate the process group, then kill it after the grace
+                    # period, and read the rest of the output
+                    if stopping:
+                        limits.signal_group(process.pid, signal.SIGKILL)
+                        deadline = None
+                        remaining = None
+                    else:
+                        limits.signal_group(process.pid, signal.SIGTERM)
+                        deadline = time.monotonic() + settings.CARTOGRAM_KILL_GRACE
+                        remaining = settings.CARTOGRAM_KILL_GRACE
+                        stopping = True
+
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, READ_CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    if key.data == "stderr" and stderr_buffer:
+                        yield "stderr", stderr_buffer
+                    continue
+
+                if key.data == "stdout":
+                    yield "stdout", data
+                    continue
+
+                # Keep the incomplete last line until the rest of it arrives
+                *lines, stderr_buffer = (stderr_buffer + data).split(b"\n")
+                for line in lines:
+                    yield "stderr", line + b"\n"
 
 
 def validate_options(options: list[str]) -> None:
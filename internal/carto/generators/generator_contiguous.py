@@ -1,8 +1,7 @@
 from carto.datajson import CartoJson
 from carto.generators.cpp_wrapper import run_binary
 from carto.progress import CartoProgress
-from errors import CartoError
-from utils import geojson_utils
+from errors import CartoBusyError, CartoError
 
 
 def generate(
@@ -13,16 +12,17 @@ def generate(
     area_data_path: str,
     data_col: str,
     data_name: str,
-    final_bbox: list[float],
     flags: list[str],
     progress: CartoProgress,
-):
+    usage: dict | None = None,
+) -> tuple[CartoJson, list[str]]:
     """
-    Generate cartogram for a data column and save them to JSON file.
+    Generate cartogram for a data column.
 
-    This function create a cartogram using an external binary tool,
-    post-processes the result, and saves both original and simplified
-    versions to the project directory.
+    This function create a cartogram using an external binary tool and
+    post-processes the result. The simplified version is saved to the project
+    directory, the original version is returned to be saved once the bounding
+    box of all cartograms is known.
 
     Args:
         project_path: Directory path where output files will be saved
@@ -31,13 +31,13 @@ def generate(
         equal_area_centroid: Dictionary containing x,y coordinates of the centroid (for adjusting the scale)
         area_data_path: Path to the csv input data file containing area information
         data_col: The column name in the csv to generate cartograms for
-        data_name: Base file name to save cartogram to
-        final_bbox: The bounding box that will be expanded to include all cartograms
+        data_name: Base file name to save the simplified cartogram to
         flags: List of command-line flags to pass to the cartogram generation binary
         progress: Progress tracking object for monitoring generation status
+        usage: Dictionary updated with the resources used by the binary, see run_binary
 
     Returns:
-        list[float]: Updated bounding box that encompasses the generated cartogram
+        tuple: The post-processed cartogram (not yet saved), and warnings from the binary
 
     Raises:
         CartoError: If cartogram generation fails for any data column
@@ -61,8 +61,11 @@ def generate(
                 "--do_not_fail_on_intersections",
             ],
             progress,
+            usage=usage,
         )
 
+    except CartoBusyError:
+        raise
     except CartoError as e:
         raise CartoError(f"Cannot generate cartogram for {data_col}. {e.message}")
     except Exception:
@@ -74,15 +77,9 @@ def generate(
 
     is_world = True if "--world" in flags else False
 
-    # Extract and post-process the original cartogram data, save it to a file
+    # Extract and post-process the original cartogram data
     cartogram_json = CartoJson(cartogram_gen_output_json["Original"], is_world)
     cartogram_json.postprocess(equal_area_area, equal_area_centroid)
-    cartogram_json.save(project_path, f"{data_name}.json", is_projected=True)
-
-    # Update the final bounding box to include this cartogram's extent
-    final_bbox = geojson_utils.union_bounding_boxes(
-        final_bbox, cartogram_json.json_data["bbox"]
-    )
 
     # Save the simplified version of the cartogram to a separate JSON file
     cartogram_json_simplified = CartoJson(
@@ -94,5 +91,4 @@ def generate(
         is_projected=True,
     )
 
-    # Return the updated bounding box that encompasses the generated cartogram
-    return final_bbox, cartogram_gen_output_json.get("Warnings", [])
+    return cartogram_json, cartogram_gen_output_json.get("Warnings", [])
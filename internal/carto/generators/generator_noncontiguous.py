@@ -6,28 +6,25 @@ from carto.datajson import CartoJson
 
 
 def generate(
-    project_path: str,
     equal_area_cdf: CartoDataFrame,
     merged_cdf: CartoDataFrame,
     data_col: str,
-    data_name: str,
-    final_bbox: list[float],
     scale_factor: float = 0.9,
-):
+) -> CartoJson:
     """
-    Generate cartograms for all specified data columns and save them as JSON files.
+    Generate a non-contiguous cartogram for a data column.
 
     This function creates non-contiguous cartograms where regions are scaled based on
     data values, with larger values resulting in larger region representations.
 
     Args:
-        project_path: Directory path where output files will be saved
         equal_area_cdf: CartoDataFrame of the equal area map
         merged_cdf: CartoDataFrame containing the equal area map merged with the data values to visualize
         data_col: Column name in merged_cdf to create cartogram for
-        data_name: Output file name
-        final_bbox: Bounding box coordinates [min_x, min_y, max_x, max_y] for the output
         scale_factor : Overall scaling factor to apply, default 0.9
+
+    Returns:
+        CartoJson: The post-processed cartogram, not yet saved
     """
     # Create a copy to avoid modifying original data
     scaled_cdf = equal_area_cdf.copy()
@@ -66,8 +63,7 @@ def generate(
 
     scaled_cdf["geometry"] = scaled_geoms
 
-    # Save the cartogram to a JSON file
     cartogram_json = CartoJson(scaled_cdf.to_json_obj())
-    cartogram_json.json_data["bbox"] = final_bbox
     cartogram_json.postprocess()
-    cartogram_json.save(project_path, f"{data_name}.json", is_projected=True)
+
+    return cartogram_json
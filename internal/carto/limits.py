@@ -0,0 +1,154 @@
+import logging
+import os
+import resource
+import signal
+import subprocess
+import time
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+#: Clock ticks per second, the unit of CPU times in /proc/<pid>/stat
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def apply_limits(pid: int) -> None:
+    """
+    Apply the resource envelope of cartogram binaries to a started process.
+
+    Limits are applied from the parent right after the process starts instead of in
+    preexec_fn, which is not safe when other threads are running. The CPU time limit
+    first sends SIGXCPU, and SIGKILL after CARTOGRAM_KILL_GRACE more seconds.
+
+    Args:
+        pid: Process id of the binary
+    """
+    try:
+        if settings.CARTOGRAM_CPU_LIMIT:
+            hard_limit = settings.CARTOGRAM_CPU_LIMIT + max(
+                1, int(settings.CARTOGRAM_KILL_GRACE)
+            )
+            resource.prlimit(
+                pid, resource.RLIMIT_CPU, (settings.CARTOGRAM_CPU_LIMIT, hard_limit)
+            )
+
+        if settings.CARTOGRAM_MEMORY_LIMIT:
+            resource.prlimit(
+                pid,
+                resource.RLIMIT_AS,
+                (settings.CARTOGRAM_MEMORY_LIMIT, settings.CARTOGRAM_MEMORY_LIMIT),
+            )
+
+        if settings.CARTOGRAM_NICE:
+            os.setpriority(os.PRIO_PROCESS, pid, settings.CARTOGRAM_NICE)
+
+        if settings.CARTOGRAM_CPU_AFFINITY:
+            os.sched_setaffinity(pid, settings.CARTOGRAM_CPU_AFFINITY)
+    except ProcessLookupError:
+        # The process has already finished
+        pass
+    except OSError as e:
+        logger.warning("Cannot apply resource limits to process %d: %s", pid, e)
+
+
+def signal_group(pid: int, sig: int) -> None:
+    """
+    Send a signal to the process group led by a binary, so any process it started is
+    stopped too.
+
+    Args:
+        pid: Process id of the binary, started in its own process group
+        sig: Signal to send
+    """
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        # The process group has already exited
+        pass
+
+
+def wait_process(process: subprocess.Popen, grace: float) -> dict[str, float] | None:
+    """
+    Wait for a binary to exit and reap it, so no zombie is left behind.
+
+    The process group is killed if the binary does not exit within the grace period.
+    Any process left in the group is killed before the binary is reaped, while the
+    group id cannot be reused yet.
+
+    Args:
+        process: The binary, started in its own process group
+        grace: Seconds to wait before killing the process group
+
+    Returns:
+        dict | None: Resource usage like get_usage, or None if the process has already
+                     been reaped
+    """
+    try:
+        deadline = time.monotonic() + grace
+        # Wait without reaping, so the process group id stays reserved
+        while not os.waitid(
+            os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT
+        ):
+            if time.monotonic() >= deadline:
+                signal_group(process.pid, signal.SIGKILL)
+                os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+                break
+            time.sleep(0.01)
+
+        signal_group(process.pid, signal.SIGKILL)
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return None
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return get_usage(rusage)
+
+
+def get_usage(rusage: resource.struct_rusage) -> dict[str, float]:
+    """
+    Get the resources used by a finished process.
+
+    Args:
+        rusage: Resource usage returned by os.wait4
+
+    Returns:
+        dict: cpu_time (user and system CPU seconds) and max_rss (peak resident memory
+              in bytes)
+    """
+    return {
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss": rusage.ru_maxrss * 1024,
+    }
+
+
+def read_usage(pid: int) -> dict[str, float] | None:
+    """
+    Get the resources used so far by a running process from /proc.
+
+    Used when the process is reaped by someone else, e.g. asyncio, so os.wait4 is not
+    available. The result is only as recent as the last call.
+
+    Args:
+        pid: Process id
+
+    Returns:
+        dict | None: cpu_time and max_rss like get_usage, or None if not available
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Skip the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            max_rss = next(
+                int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:")
+            )
+    except (OSError, IndexError, StopIteration, ValueError):
+        return None
+
+    # utime and stime are the 14th and 15th fields of the stat line
+    return {
+        "cpu_time": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "max_rss": max_rss,
+    }
@@ -1,11 +1,205 @@
+import heapq
+import io
+import logging
 import warnings
 
 import gcol
+import numpy as np
+import shapely
+from carto.cache import CartoCache
 from geopandas import GeoDataFrame
 from libpysal.weights import Rook
+from scipy import sparse
 
+logger = logging.getLogger(__name__)
 
-def assign_colors(gdf: GeoDataFrame):
+#: Number of color groups assigned to regions
+COLOR_COUNT = 6
+
+
+def assign_colors(gdf: GeoDataFrame, cache_key: str | None = None):
+    """
+    Assign one of COLOR_COUNT color groups to each region, so that regions sharing a
+    border have different groups and the groups are about the same size.
+
+    Args:
+        gdf: Regions to color
+        cache_key: Key identifying the geometries to cache their adjacency, see
+            load_adjacency
+
+    Returns:
+        pd.Index: Color group of each region, in the order of the data frame
+    """
+    try:
+        colors = color_graph(
+            load_adjacency(gdf.geometry.values, cache_key), COLOR_COUNT
+        )
+        if colors is not None:
+            return gdf.index.map(dict(zip(gdf.index, colors.tolist())))
+    except Exception:
+        logger.exception("Cannot color regions, falling back to GCol")
+
+    return _assign_colors_gcol(gdf)
+
+
+def load_adjacency(geometries, cache_key: str | None = None) -> sparse.csr_array:
+    """
+    Get the rook adjacency of polygons like get_adjacency, reusing the adjacency of
+    identical geometries if it is cached.
+
+    Args:
+        geometries: Array of Polygon and MultiPolygon geometries
+        cache_key: Key identifying the geometries, such as the hash of the boundary
+            file they are read from (None = not cached)
+
+    Returns:
+        sparse.csr_array: Symmetric boolean adjacency matrix
+    """
+    cache = CartoCache("adjacency")
+    if cache_key is None or not cache.enabled:
+        return get_adjacency(geometries)
+
+    data = cache.get(cache_key)
+    if data is not None:
+        return sparse.csr_array(sparse.load_npz(io.BytesIO(data)))
+
+    adjacency = get_adjacency(geometries)
+
+    buffer = io.BytesIO()
+    sparse.save_npz(buffer, adjacency)
+    cache.set(cache_key, buffer.getvalue())
+
+    return adjacency
+
+
+def get_adjacency(geometries) -> sparse.csr_array:
+    """
+    Build the rook adjacency of polygons, i.e. which of them share a border segment.
+
+    Segments are compared by their end points, so two polygons are neighbours if
+    they both have the same two consecutive vertices in one of their rings.
+
+    Args:
+        geometries: Array of Polygon and MultiPolygon geometries
+
+    Returns:
+        sparse.csr_array: Symmetric boolean adjacency matrix
+    """
+    count = len(geometries)
+
+    # Coordinates of all rings, with the index of the geometry each belongs to
+    parts, part_index = shapely.get_parts(geometries, return_index=True)
+    rings, ring_index = shapely.get_rings(parts, return_index=True)
+    coords, coord_index = shapely.get_coordinates(rings, return_index=True)
+    region = part_index[ring_index[coord_index]]
+
+    # Segments between consecutive vertices of the same ring
+    same_ring = coord_index[:-1] == coord_index[1:]
+    start = coords[:-1][same_ring]
+    end = coords[1:][same_ring]
+    region = region[:-1][same_ring]
+
+    # Order the end points so a segment is the same in both directions
+    swap = (start[:, 0] > end[:, 0]) | (
+        (start[:, 0] == end[:, 0]) & (start[:, 1] > end[:, 1])
+    )
+    start[swap], end[swap] = end[swap], start[swap]
+
+    # Hash segments by their bytes, and keep each region once per segment
+    segments = np.ascontiguousarray(np.hstack([start, end]))
+    keys = segments.view(np.dtype((np.void, segments.dtype.itemsize * 4))).ravel()
+    _, segment_id = np.unique(keys, return_inverse=True)
+    pairs = np.unique(np.column_stack([segment_id.ravel(), region]), axis=0)
+
+    # Connect the regions of each segment shared by more than one region
+    rows = []
+    cols = []
+    group_start = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+    group_size = np.diff(np.r_[group_start, len(pairs)])
+    for size in np.unique(group_size[group_size > 1]):
+        members = pairs[group_start[group_size == size][:, None] + np.arange(size), 1]
+        for i in range(size):
+            for j in range(size):
+                if i != j:
+                    rows.append(members[:, i])
+                    cols.append(members[:, j])
+
+    if rows:
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+    else:
+        rows = cols = np.array([], dtype=np.intp)
+
+    adjacency = sparse.csr_array(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(count, count)
+    )
+    adjacency.sum_duplicates()
+    return adjacency
+
+
+def color_graph(adjacency: sparse.csr_array, k: int) -> np.ndarray | None:
+    """
+    Color a graph with at most k colors using DSATUR, then balance the color classes.
+
+    DSATUR colors the vertex with the most distinctly colored neighbours next, with
+    the smallest color available. Vertices are then moved from large classes to the
+    smallest class their neighbours allow, until no move makes the classes more even.
+
+    Args:
+        adjacency: Symmetric adjacency matrix
+        k: Number of colors
+
+    Returns:
+        np.ndarray | None: Color (0 to k - 1) of each vertex, or None if DSATUR needs
+                           more than k colors
+    """
+    indptr = adjacency.indptr
+    indices = adjacency.indices
+    count = adjacency.shape[0]
+    degree = np.diff(indptr)
+
+    colors = np.full(count, -1, dtype=np.intp)
+    neighbour_colors = [set() for _ in range(count)]
+    heap = [(0, -int(degree[v]), v) for v in range(count)]
+    heapq.heapify(heap)
+
+    while heap:
+        saturation, _, v = heapq.heappop(heap)
+        if colors[v] >= 0 or -saturation != len(neighbour_colors[v]):
+            # Already colored, or an outdated entry
+            continue
+
+        color = next(c for c in range(k + 1) if c not in neighbour_colors[v])
+        if color == k:
+            return None
+        colors[v] = color
+
+        for u in indices[indptr[v] : indptr[v + 1]]:
+            if colors[u] < 0 and color not in neighbour_colors[u]:
+                neighbour_colors[u].add(color)
+                heapq.heappush(
+                    heap, (-len(neighbour_colors[u]), -int(degree[u]), int(u))
+                )
+
+    # Move vertices to smaller classes; each move reduces the sum of squared sizes
+    sizes = np.bincount(colors, minlength=k)
+    moved = True
+    while moved:
+        moved = False
+        for v in range(count):
+            used = set(colors[indices[indptr[v] : indptr[v + 1]]].tolist())
+            free = [c for c in range(k) if c not in used]
+            target = min(free, key=lambda c: sizes[c])
+            if sizes[target] + 1 < sizes[colors[v]]:
+                sizes[colors[v]] -= 1
+                sizes[target] += 1
+                colors[v] = target
+                moved = True
+
+    return colors
+
+
+def _assign_colors_gcol(gdf: GeoDataFrame):
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
 
@@ -17,6 +211,6 @@ def assign_colors(gdf: GeoDataFrame):
         graph = weight.to_networkx()  # type: ignore
 
         # Run GCol coloring
-        colors = gcol.equitable_node_k_coloring(graph, 6)  # type: ignore
+        colors = gcol.equitable_node_k_coloring(graph, COLOR_COUNT)  # type: ignore
 
         return gdf.index.map(colors)
@@ -1,56 +1,106 @@
 import json
+import threading
+import time
+from collections.abc import Generator
 
-import redis
+import redis_pool
 import settings
 
+# Replace the stored progress unless it is newer, then notify progress streams.
+# KEYS[1]: progress key
+# ARGV[1]: progress to store, ARGV[2]: its order, ARGV[3]: expiry in seconds,
+# ARGV[4]: progress to publish
+UPDATE_SCRIPT = """
+local current = redis.call("GET", KEYS[1])
+if current then
+    local ok, stored = pcall(cjson.decode, current)
+    if ok and tonumber(stored["order"]) >= tonumber(ARGV[2]) then
+        return 0
+    end
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[3])
+redis.call("PUBLISH", KEYS[1], ARGV[4])
+return 1
+"""
+
 
 class CartoProgress:
+    """
+    Progress reporter for a cartogram generation, stored in Redis.
+
+    Several data columns may be generated at the same time, so the progress of each
+    column is tracked separately and the overall progress is the average of them.
+    """
+
     def __init__(self, key: str):
-        self.redis_conn = redis.Redis(
-            host=settings.CARTOGRAM_REDIS_HOST, port=settings.CARTOGRAM_REDIS_PORT, db=0
-        )
+        self.redis_conn = redis_pool.get_connection()
         self.key = key
+        self.lock = threading.Lock()
+        #: Sequence number of the latest update, used to discard stale updates. It
+        #: follows the clock (in microseconds), so the updates of a retried generation
+        #: are newer than those of earlier attempts, even from another worker
+        self.order = time.time_ns() // 1000
+        #: Time of the latest update sent to Redis
+        self.last_update = 0.0
+        self.update_script = self.redis_conn.register_script(UPDATE_SCRIPT)
         self.setData([])
 
     def setData(self, data_cols: list[str]) -> None:
         self.data_cols = data_cols
         self.data_len = len(data_cols)
-        self.data_number = 0
+        #: Progress (0 to 1) of each data column that has been started
+        self.data_progress = {}
 
     def start(self, name: str = ""):
-        self.data_number = self.data_number + 1
-        self.set(0, "", name, progress=0)
-
-    def set(self, order: int, stderr: str, name: str, progress: float) -> None:
-        # Calculate overall progress across multiple datasets
-        if progress == 1 and self.data_number >= self.data_len:
-            # Handle edge case: ensure final progress reaches exactly 1.0
-            overall_progress = 1
-        else:
-            overall_progress = (progress - 1 + self.data_number) / float(self.data_len)
+        self.set("", name, progress=0)
 
-        progress_db = self.redis_conn.get("cartprogress-{}".format(self.key))
+    def set(self, stderr: str, name: str, progress: float) -> None:
+        with self.lock:
+            self.data_progress[name] = progress
 
-        if progress_db is None:
-            progress_db = {
-                "order": order,
-                "stderr": stderr,
-                "name": name,
-                "progress": overall_progress,
-            }
-        else:
-            progress_db = json.loads(progress_db.decode())
+            # Calculate overall progress across multiple datasets
+            if self.data_len == 0:
+                overall_progress = progress
+            elif len(self.data_progress) >= self.data_len and all(
+                value == 1 for value in self.data_progress.values()
+            ):
+                # Handle edge case: ensure final progress reaches exactly 1.0
+                overall_progress = 1
+            else:
+                overall_progress = sum(self.data_progress.values()) / float(
+                    self.data_len
+                )
 
-            if progress_db["order"] < order:
-                progress_db = {
-                    "order": order,
-                    "stderr": stderr,
-                    "name": name,
-                    "progress": overall_progress,
-                }
+            # Publish at most CARTOGRAM_PROGRESS_RATE updates per second,
+            # but never skip the update that completes a data column
+            now = time.monotonic()
+            if (
+                progress != 1
+                and settings.CARTOGRAM_PROGRESS_RATE
+                and now - self.last_update < 1 / settings.CARTOGRAM_PROGRESS_RATE
+            ):
+                return
 
-        self.redis_conn.set("cartprogress-{}".format(self.key), json.dumps(progress_db))
-        self.redis_conn.expire("cartprogress-{}".format(self.key), 300)
+            self.last_update = now
+            self.order = max(self.order + 1, time.time_ns() // 1000)
+            order = self.order
+
+        progress_output = {
+            "stderr": stderr,
+            "name": name,
+            "progress": overall_progress,
+        }
+
+        # Update and notify progress streams in one atomic step on the server
+        self.update_script(
+            keys=["cartprogress-{}".format(self.key)],
+            args=[
+                json.dumps({"order": order, **progress_output}),
+                order,
+                300,
+                json.dumps(progress_output),
+            ],
+        )
 
         if self.key == "batch":
             print(overall_progress)
@@ -61,9 +111,70 @@ class CartoProgress:
         if current_progress is None:
             return {"progress": None, "stderr": ""}
         else:
-            current_progress = json.loads(current_progress.decode())
-            return {
-                "name": current_progress["name"],
-                "progress": current_progress["progress"],
-                "stderr": current_progress["stderr"],
-            }
+            return self._to_output(json.loads(current_progress.decode()))
+
+    def stream(
+        self, timeout: float | None = None, keepalive: float = 10, retry: int = 1000
+    ) -> Generator[str, None, None]:
+        """
+        Stream progress updates as Server-Sent Events for a short while.
+
+        Updates are received from the Redis channel that set() publishes to, so no
+        polling is needed. A comment line is sent when there is no update for a while
+        to keep the connection open. The stream ends with a "done" event when the
+        generation finishes, which the client closes on. Otherwise it ends after the
+        timeout, so a worker is held only briefly, and the client reconnects after
+        `retry` milliseconds.
+
+        Args:
+            timeout: Maximum number of seconds to stream. Defaults to
+                CARTOGRAM_PROGRESS_STREAM_TIME.
+            keepalive: Number of seconds without update before sending a comment line
+            retry: Number of milliseconds the client waits before reconnecting
+
+        Yields:
+            str: Server-Sent Events messages
+        """
+        if timeout is None:
+            timeout = settings.CARTOGRAM_PROGRESS_STREAM_TIME
+
+        pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("cartprogress-{}".format(self.key))
+
+        try:
+            yield f"retry: {retry}\n\n"
+
+            # Send the current progress first, the update may have been published already
+            current_progress = self.get()
+            yield self._to_event(json.dumps(current_progress), current_progress)
+            if current_progress["progress"] == 1:
+                return
+
+            deadline = time.monotonic() + timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                message = pubsub.get_message(timeout=min(keepalive, remaining))
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+
+                data = message["data"].decode()
+                progress_output = json.loads(data)
+                yield self._to_event(data, progress_output)
+                if progress_output["progress"] == 1:
+                    return
+        finally:
+            pubsub.close()
+
+    @staticmethod
+    def _to_event(data: str, progress_output: dict) -> str:
+        if progress_output["progress"] == 1:
+            return f"event: done\ndata: {data}\n\n"
+
+        return f"data: {data}\n\n"
+
+    def _to_output(self, progress_db: dict) -> dict:
+        return {
+            "name": progress_db["name"],
+            "progress": progress_db["progress"],
+            "stderr": progress_db["stderr"],
+        }
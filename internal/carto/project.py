@@ -1,12 +1,17 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from carto import boundary
+import handlers
+import pandas as pd
+import settings
+from carto import boundary, fingerprints
 from carto.datacsv import CartoCsv
 from carto.dataframe import CartoDataFrame
+from carto.datajson import CartoJson
 from carto.generators import generator_contiguous, generator_noncontiguous
 from carto.progress import CartoProgress
-from utils import file_utils
+from utils import file_utils, geojson_utils
 
 
 def generate(
@@ -17,33 +22,186 @@ def generate(
     project_path,
     clean_by=None,
     flags=[],
+    handler_name=None,
+    source_path=None,
+    usage=None,
 ) -> list[str]:
     datacsv = CartoCsv(csv_string, vis_types)
     area_data_path = datacsv.save(project_path, "data.csv")
 
+    # Unchanged data of a built-in map is served from its precomputed cartograms
+    handler_entries = None
+    if handler_name is not None and not flags and clean_by in (None, "", "Region"):
+        handler_entries = _reuse_handler_outputs(
+            handler_name, datacsv, vis_types, project_path
+        )
+
     # Process the boundary file
-    cdf = CartoDataFrame.read_file(input_file)
+    # The boundary of a built-in map is a copy of its checked Input.json
+    cdf = CartoDataFrame.read_file(
+        input_file,
+        trusted=handler_name is not None and handlers.has_handler(handler_name),
+    )
 
     if (clean_by is not None and clean_by != "") or datacsv.map_regions_dict != {}:
         cdf.clean_properties(
             clean_by or "Region", map_names_dict=datacsv.map_regions_dict
         )
 
-    equal_area_json = boundary.generate_equal_area(
-        cdf, input_file, area_data_path, flags
+    # Outputs of the edited project that would be generated from the same data
+    # The boundary is fingerprinted as rewritten for the binary, which is the same for
+    # a built-in map, an uploaded file and the copy saved with the edited project
+    boundary_json = cdf.to_carto_file(input_file)
+    output_fingerprints = fingerprints.get_fingerprints(
+        input_file, datacsv, vis_types, clean_by, flags
     )
-    equal_area_file = equal_area_json.save(project_path, "Geographic Area.json")
-    final_bbox = equal_area_json.geoms_info["bbox"].copy()
 
     # Set up progress reporter
     progress = CartoProgress(cartogram_key)
     progress.setData(datacsv.data_cols)
 
+    if handler_entries is not None:
+        # The linked outputs can be reused when the project is edited
+        for data_name, entry in handler_entries.items():
+            entry["fingerprint"] = output_fingerprints[data_name]
+
+        fingerprints.save(
+            project_path,
+            handler_entries,
+            handler_entries["Geographic Area"]["bbox"],
+        )
+        for data_col in datacsv.data_cols:
+            progress.set("", data_col, 1)
+
+        return []
+
+    reused = {}
+    if source_path:
+        reused = fingerprints.reuse(source_path, project_path, output_fingerprints)
+
+    cartogram_cols = [
+        data_col
+        for data_col in datacsv.data_cols
+        if vis_types.get(data_col) in ("contiguous", "noncontiguous")
+    ]
+    pending_cols = [
+        data_col
+        for data_col in cartogram_cols
+        if datacsv.data_names.get(data_col, "Data") not in reused
+    ]
+
+    # Cartograms to save once the bounding box of all of them is known
+    outputs = {}
+    # Manifest entries of all outputs, see fingerprints.save
+    entries = dict(reused)
+
+    final_bbox = None
+    for entry in reused.values():
+        final_bbox = (
+            entry["bbox"]
+            if final_bbox is None
+            else geojson_utils.union_bounding_boxes(final_bbox, entry["bbox"])
+        )
+
+    if pending_cols or "Geographic Area" not in reused:
+        equal_area_usage = {}
+        equal_area_json = boundary.generate_equal_area(
+            cdf,
+            input_file,
+            area_data_path,
+            flags,
+            geojson=boundary_json,
+            usage=equal_area_usage,
+        )
+        if usage is not None and equal_area_usage:
+            usage["Geographic Area"] = equal_area_usage
+
+        if "Geographic Area" not in reused:
+            outputs["Geographic Area"] = equal_area_json
+            entries["Geographic Area"] = {
+                "fingerprint": output_fingerprints["Geographic Area"],
+                "bbox": equal_area_json.geoms_info["bbox"],
+                "warnings": [],
+                "files": ["Geographic Area.json"],
+            }
+            final_bbox = (
+                equal_area_json.geoms_info["bbox"].copy()
+                if final_bbox is None
+                else geojson_utils.union_bounding_boxes(
+                    final_bbox, equal_area_json.geoms_info["bbox"]
+                )
+            )
+
+    if pending_cols:
+        _generate_cartograms(
+            datacsv,
+            vis_types,
+            input_file,
+            project_path,
+            area_data_path,
+            equal_area_json,
+            pending_cols,
+            flags,
+            progress,
+            output_fingerprints,
+            outputs,
+            entries,
+            usage,
+        )
+
+        for data_col in pending_cols:
+            data_name = datacsv.data_names.get(data_col, "Data")
+            final_bbox = geojson_utils.union_bounding_boxes(
+                final_bbox, entries[data_name]["bbox"]
+            )
+
+    for data_col in datacsv.data_cols:
+        if data_col not in pending_cols:
+            progress.set("", data_col, 1)
+
+    # Save with the same bounding box so all visualized geojson are aligned
+    for data_name, carto_json in outputs.items():
+        carto_json.json_data["bbox"] = final_bbox
+        carto_json.save(project_path, f"{data_name}.json", is_projected=True)
+
+    for data_name in reused:
+        fingerprints.set_bbox(project_path, f"{data_name}.json", final_bbox)
+
+    fingerprints.save(project_path, entries, final_bbox)
+
+    all_warnings = []
+    for data_col in cartogram_cols:
+        all_warnings += entries[datacsv.data_names.get(data_col, "Data")]["warnings"]
+
+    return all_warnings
+
+
+def _generate_cartograms(
+    datacsv: CartoCsv,
+    vis_types: dict,
+    input_file: str,
+    project_path: str,
+    area_data_path: str,
+    equal_area_json: CartoJson,
+    data_cols: list[str],
+    flags: list[str],
+    progress: CartoProgress,
+    output_fingerprints: dict[str, str],
+    outputs: dict[str, CartoJson],
+    entries: dict[str, dict],
+    usage: dict[str, dict] | None = None,
+) -> None:
+    """
+    Generate the cartograms of data columns, adding them to outputs and entries, and
+    the resources used by their binary runs to usage.
+
+    Contiguous cartograms are generated concurrently, each in its own binary run.
+    """
     # Prepare data for noncontiguous
     # Merge the geographic data with the statistical data on the "Region" column
     # Uses left join to preserve all geographic regions
     # For columns with the same names, use data from the csv
-    equal_area_cdf = CartoDataFrame.read_file(equal_area_file)
+    equal_area_cdf = CartoDataFrame.from_json_obj(equal_area_json.json_data)
     merged_cdf = equal_area_cdf.merge(
         datacsv.df, on="Region", how="left", suffixes=("_drop", None)
     )
@@ -51,53 +209,178 @@ def generate(
     if equal_area_cdf.is_world:
         flags = flags + ["--world"]
 
-    all_warnings = []
+    contiguous_cols = [
+        data_col for data_col in data_cols if vis_types.get(data_col) == "contiguous"
+    ]
 
-    for data_col in datacsv.data_cols:
+    def generate_contiguous(data_col):
         progress.start(data_col)
+        run_usage = {}
+        result = generator_contiguous.generate(
+            project_path,
+            input_file,
+            equal_area_json.geoms_info.get("area", 1),
+            equal_area_json.geoms_info.get("centroid", {"x": 0, "y": 0}),
+            area_data_path,
+            data_col,
+            datacsv.data_names.get(data_col, "Data"),
+            flags,
+            progress,
+            usage=run_usage,
+        )
+        if usage is not None and run_usage:
+            usage[datacsv.data_names.get(data_col, "Data")] = run_usage
+        progress.set("", data_col, 1)
+        return result
 
+    def add_output(data_col, cartogram_json, warning_msgs):
+        data_name = datacsv.data_names.get(data_col, "Data")
+        files = [f"{data_name}.json"]
         if vis_types.get(data_col) == "contiguous":
-            # Generate contiguous cartograms
-            final_bbox, warning_msgs = generator_contiguous.generate(
-                project_path,
-                input_file,
-                equal_area_json.geoms_info.get("area", 1),
-                equal_area_json.geoms_info.get("centroid", {"x": 0, "y": 0}),
-                area_data_path,
-                data_col,
-                datacsv.data_names.get(data_col, "Data"),
-                final_bbox,
-                flags,
-                progress,
-            )
+            files.append(f"{data_name}_simplified.json")
 
-            all_warnings = all_warnings + warning_msgs
-        elif vis_types.get(data_col) == "noncontiguous":
-            # Generate non-contiguous cartograms
-            generator_noncontiguous.generate(
-                project_path,
-                equal_area_cdf,
-                merged_cdf,
-                data_col,
-                datacsv.data_names.get(data_col, "Data"),
-                final_bbox,
-            )
+        outputs[data_name] = cartogram_json
+        entries[data_name] = {
+            "fingerprint": output_fingerprints[data_name],
+            "bbox": cartogram_json.geoms_info["bbox"],
+            "warnings": warning_msgs,
+            "files": files,
+        }
+
+    # Generate contiguous cartograms concurrently, each in its own binary run
+    max_workers = min(settings.CARTOGRAM_REQUEST_WORKERS, len(contiguous_cols) or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            data_col: executor.submit(generate_contiguous, data_col)
+            for data_col in contiguous_cols
+        }
+
+        try:
+            for data_col in data_cols:
+                if data_col in futures:
+                    continue
+
+                # Generate non-contiguous cartograms
+                progress.start(data_col)
+                add_output(
+                    data_col,
+                    generator_noncontiguous.generate(
+                        equal_area_cdf, merged_cdf, data_col
+                    ),
+                    [],
+                )
+                progress.set("", data_col, 1)
+
+            # Collect results in column order so the output is deterministic
+            for data_col in contiguous_cols:
+                add_output(data_col, *futures[data_col].result())
+
+        except Exception:
+            # Do not start the remaining columns if one of them fails
+            for future in futures.values():
+                future.cancel()
+            raise
+
+
+def _reuse_handler_outputs(
+    handler_name: str, datacsv: CartoCsv, vis_types: dict, project_path: str
+) -> dict[str, dict] | None:
+    """
+    Link the precomputed cartograms of a built-in map into the project if the submitted
+    data would produce the same cartograms.
+
+    The regions, insets, geographic areas and the values of every column visualized as
+    a cartogram must match the map's data.csv, with the same visualization type. Other
+    columns, such as colors, labels and choropleth data, do not change the cartograms.
 
-        progress.set(1, "", data_col, 1)
+    Args:
+        handler_name: Name of the built-in map
+        datacsv: Submitted data
+        vis_types: Submitted visualization types
+        project_path: Directory of the project
 
-    # Update bbox so all visualized geojson have the same bounding box
-    for data_col in ["Geographic Area"] + datacsv.data_cols:
-        file_path = file_utils.get_safepath(
-            project_path, f"{datacsv.data_names.get(data_col, 'Data')}.json"
+    Returns:
+        dict | None: Manifest entries of the linked outputs by data name, without
+            their fingerprints, or None if the cartograms were not linked
+    """
+    if not handlers.has_handler(handler_name) or datacsv.map_regions_dict:
+        return None
+
+    handler_path = file_utils.get_safepath("static/cartdata", handler_name)
+    handler_csv_path = os.path.join(handler_path, "data.csv")
+    if not os.path.exists(handler_csv_path):
+        return None
+
+    handler_types = handlers.get_handler(handler_name).get(
+        "types", {"Population (people)": "contiguous"}
+    )
+    cartogram_cols = [
+        data_col
+        for data_col in datacsv.data_cols
+        if vis_types.get(data_col) in ("contiguous", "noncontiguous")
+    ]
+    if any(vis_types[col] != handler_types.get(col) for col in cartogram_cols):
+        return None
+
+    with open(handler_csv_path, "r") as f:
+        handler_csv = CartoCsv(f.read(), handler_types)
+
+    if not _same_cartogram_data(datacsv.df, handler_csv.df, cartogram_cols):
+        return None
+
+    files = {"Geographic Area": ["Geographic Area.json"]}
+    for data_col in cartogram_cols:
+        data_name = datacsv.data_names.get(data_col, "Data")
+        files[data_name] = [f"{data_name}.json"]
+        if vis_types[data_col] == "contiguous":
+            files[data_name].append(f"{data_name}_simplified.json")
+
+    names = [name for data_files in files.values() for name in data_files]
+    sources = [os.path.join(handler_path, name) for name in names]
+    if not all(os.path.exists(source) for source in sources):
+        return None
+
+    for name, source in zip(names, sources):
+        destination = file_utils.get_safepath(project_path, name)
+        file_utils.link_or_copy(
+            source, destination, compressed=settings.CARTOGRAM_PRECOMPRESS
         )
 
-        if not os.path.exists(file_path):
-            continue
+    # The precomputed outputs share one bounding box, which bounds each of them
+    with open(sources[0]) as f:
+        bbox = json.load(f).get("bbox")
 
-        with open(file_path, "r") as f:
-            geo_json = json.load(f)
-        geo_json["bbox"] = final_bbox
-        with open(file_path, "w") as outfile:
-            outfile.write(json.dumps(geo_json))
+    return {
+        data_name: {"bbox": bbox, "warnings": [], "files": data_files}
+        for data_name, data_files in files.items()
+    }
 
-    return all_warnings
+
+def _same_cartogram_data(
+    df: pd.DataFrame, handler_df: pd.DataFrame, cartogram_cols: list[str]
+) -> bool:
+    """Compare the columns of two data frames that the cartograms are generated from."""
+
+    def get_key_cols(df):
+        return [
+            col
+            for col in df.columns
+            if col in ("Region", "Inset") or col.startswith("Geographic Area")
+        ]
+
+    cols = get_key_cols(df) + cartogram_cols
+    if (
+        set(get_key_cols(df)) != set(get_key_cols(handler_df))
+        or any(col not in handler_df.columns for col in cols)
+        or len(df) != len(handler_df)
+    ):
+        return False
+
+    df = df[cols].reset_index(drop=True)
+    handler_df = handler_df[cols].reset_index(drop=True)
+    for col in cols:
+        if col.startswith("Geographic Area"):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+            handler_df[col] = pd.to_numeric(handler_df[col], errors="coerce")
+
+    return df.equals(handler_df)
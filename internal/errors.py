@@ -35,3 +35,20 @@ class CartoError(Exception):
             status=400,
             content_type="application/json",
         )
+
+
+class CartoBusyError(CartoError):
+    """Raised when the server has no capacity for a cartogram generation right now."""
+
+    def __init__(self, retry_after: int = 10):
+        super().__init__(
+            "The server is busy generating other cartograms. Please try again in a moment.",
+            log=False,
+        )
+        self.retry_after = retry_after
+
+    def response(self, logger=None):
+        response = super().response(logger)
+        response.status_code = 503
+        response.headers["Retry-After"] = str(self.retry_after)
+        return response
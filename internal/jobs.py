@@ -0,0 +1,295 @@
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+import redis_pool
+import settings
+from carto import parser, project
+from carto.progress import CartoProgress
+from carto.storage import CartoStorage
+from database import db
+from errors import CartoBusyError, CartoError
+from models import CartogramEntry
+from utils import file_utils
+
+QUEUE_KEY = "cartjobs"
+#: Sorted set of jobs waiting to be queued again, scored by when they may run
+DELAYED_KEY = "cartjobs-delayed"
+#: List of jobs taken from the queue by a worker, until they are finished
+PROCESSING_KEY = "cartjobs-processing"
+#: Sorted set of jobs being generated, scored by when they were taken
+STARTED_KEY = "cartjobs-started"
+JOB_KEY = "cartjob-{}"
+
+
+def generate(data: dict, logger: logging.Logger) -> dict:
+    """
+    Generate (and optionally persist) a cartogram project from the submitted data.
+
+    Args:
+        data: Project data submitted to /api/v1/cartogram
+        logger: Logger for progress messages
+
+    Returns:
+        dict: mapDBKey (None if not persisted), warnings of the generation, and the
+              cpu_time (seconds) and max_rss (bytes) of each binary run by data name
+
+    Raises:
+        CartoError: If the project data is invalid or the generation fails
+    """
+    handler_name, string_key, vis_types, datacsv, edit_from = parser.parse_project(data)
+    clean_by = data.get("geojsonRegionCol", "Region")
+
+    logger.info(f"Generating cartogram for {string_key}")
+
+    # Prepare data.csv and Input.json in userdata
+    storage = CartoStorage(string_key)
+    storage.save_tmp("data.csv", datacsv)
+    gen_file = storage.standardize_tmp_input(handler_name, edit_from)
+
+    # Resources used by each binary run, by data name
+    usage = {}
+    warning_msgs = project.generate(
+        datacsv,
+        vis_types,
+        gen_file,
+        string_key,
+        storage.tmp_path,
+        clean_by=clean_by,
+        handler_name=handler_name,
+        # Unchanged outputs of the edited project are reused
+        source_path=get_source_path(data, edit_from),
+        usage=usage,
+    )
+
+    logger.info(f"Finish cartogram generation for {string_key}")
+
+    try:
+        if "persist" in data:
+            storage.persist(handler_name)
+
+            if settings.USE_DATABASE:
+                new_cartogram_entry = CartogramEntry(
+                    string_key=string_key,
+                    date_created=datetime.datetime.today(),
+                    date_accessed=datetime.datetime.now(datetime.UTC)
+                    - datetime.timedelta(days=365),
+                    handler=handler_name,
+                    title=data.get("title"),
+                    scheme=data.get("scheme"),
+                    types=json.dumps(vis_types),
+                    settings=json.dumps(data.get("settings")),
+                )
+                db.session.add(new_cartogram_entry)
+                db.session.commit()
+        else:
+            string_key = None
+
+    except Exception:
+        if settings.USE_DATABASE:
+            db.session.rollback()
+        raise
+
+    return {"mapDBKey": string_key, "warnings": warning_msgs, "usage": usage}
+
+
+def get_source_path(data: dict, edit_from: str | None) -> str | None:
+    """
+    Find the directory of the project being edited, whose unchanged outputs are reused.
+
+    A saved project is found by its key, since the boundary of a project made from a
+    built-in map is served from the map's folder. Otherwise, the project is the folder
+    of the edited boundary file.
+
+    Args:
+        data: Project data submitted to /api/v1/cartogram
+        edit_from: Path of the edited boundary file, see parser.parse_project
+
+    Returns:
+        str: Directory of the edited project, or None if no project is edited
+    """
+    if data.get("editedKey"):
+        edited_key = parser.parse_key(
+            {"mapDBKey": data["editedKey"]}, must_unique=False
+        )
+        return file_utils.get_safepath("static/userdata", edited_key)
+
+    return os.path.dirname(edit_from.lstrip("/")) if edit_from else None
+
+
+def enqueue(data: dict) -> str:
+    """
+    Validate the project data and add it to the job queue.
+
+    Args:
+        data: Project data submitted to /api/v1/cartogram
+
+    Returns:
+        str: Job id, which is the project key
+
+    Raises:
+        CartoError: If the project data is invalid or a job with the same key exists
+    """
+    _, string_key, _, _, _ = parser.parse_project(data)
+
+    redis_conn = redis_pool.get_connection()
+    job = {"status": "queued", "data": data}
+    if not redis_conn.set(
+        JOB_KEY.format(string_key),
+        json.dumps(job),
+        ex=settings.CARTOGRAM_JOB_TTL,
+        nx=True,
+    ):
+        raise CartoError("Duplicated database key.", suggest_refresh=True)
+
+    redis_conn.rpush(QUEUE_KEY, string_key)
+    return string_key
+
+
+def get_status(string_key: str) -> dict:
+    """
+    Get the status of a job, including the progress of its generation.
+
+    Args:
+        string_key: Job id returned by enqueue
+
+    Returns:
+        dict: status ("queued", "running", "done", "error" or None if unknown),
+              progress information, and the result or error when finished
+    """
+    job = redis_pool.get_connection().get(JOB_KEY.format(string_key))
+    if job is None:
+        return {"status": None, "progress": None, "stderr": ""}
+
+    job = json.loads(job.decode())
+    status = CartoProgress(string_key).get()
+    status["status"] = job["status"]
+
+    if job["status"] == "done":
+        status.update(job["result"])
+    elif job["status"] == "error":
+        status["error"] = job["error"]
+
+    return status
+
+
+def requeue_due(redis_conn) -> None:
+    """
+    Move the delayed jobs whose retry time has passed, and the jobs whose worker has
+    not finished them within CARTOGRAM_JOB_LEASE seconds, to the front of the queue.
+
+    Args:
+        redis_conn: Redis connection
+    """
+    now = time.time()
+    for string_key in redis_conn.zrangebyscore(DELAYED_KEY, 0, now):
+        # Only the worker that removes the entry queues the job
+        if redis_conn.zrem(DELAYED_KEY, string_key):
+            redis_conn.lpush(QUEUE_KEY, string_key)
+
+    for string_key in redis_conn.lrange(PROCESSING_KEY, 0, -1):
+        # A worker may have stopped before recording the start, so start it now
+        redis_conn.zadd(STARTED_KEY, {string_key: now}, nx=True)
+        started = redis_conn.zscore(STARTED_KEY, string_key)
+        if started is None or started > now - settings.CARTOGRAM_JOB_LEASE:
+            continue
+
+        if redis_conn.lrem(PROCESSING_KEY, 1, string_key):
+            redis_conn.zrem(STARTED_KEY, string_key)
+            redis_conn.lpush(QUEUE_KEY, string_key)
+
+
+def work(logger: logging.Logger) -> None:
+    """
+    Take jobs from the queue and generate them, one at a time, forever.
+
+    Args:
+        logger: Logger for progress and error messages
+    """
+    redis_conn = redis_pool.get_connection()
+
+    while True:
+        requeue_due(redis_conn)
+
+        # Wait in short rounds so the pool's socket timeout does not interrupt the wait
+        # and delayed jobs are queued again on time
+        # The job stays in the processing list until it is finished, so it is queued
+        # again by requeue_due if this worker stops
+        string_key = redis_conn.blmove(QUEUE_KEY, PROCESSING_KEY, 1, "LEFT", "RIGHT")
+        if string_key is None:
+            continue
+
+        redis_conn.zadd(STARTED_KEY, {string_key: time.time()})
+        try:
+            run_job(redis_conn, string_key.decode(), logger)
+        finally:
+            redis_conn.lrem(PROCESSING_KEY, 1, string_key)
+            redis_conn.zrem(STARTED_KEY, string_key)
+
+
+def run_job(redis_conn, string_key: str, logger: logging.Logger) -> None:
+    """
+    Generate a job taken from the queue and store its result.
+
+    Args:
+        redis_conn: Redis connection
+        string_key: Job id
+        logger: Logger for progress and error messages
+    """
+    job_key = JOB_KEY.format(string_key)
+
+    job = redis_conn.get(job_key)
+    if job is None:
+        return
+
+    job = json.loads(job.decode())
+    if job["status"] in ("done", "error"):
+        # Finished by a worker that stopped before removing it from the processing list
+        return
+
+    job["status"] = "running"
+    redis_conn.set(job_key, json.dumps(job), ex=settings.CARTOGRAM_JOB_TTL)
+
+    try:
+        job["result"] = generate(job["data"], logger)
+        job["status"] = "done"
+    except CartoBusyError as e:
+        # Queue the job again once it may be admitted, and take the next one
+        job["status"] = "queued"
+        redis_conn.set(job_key, json.dumps(job), ex=settings.CARTOGRAM_JOB_TTL)
+        redis_conn.zadd(DELAYED_KEY, {string_key: time.time() + e.retry_after})
+        return
+    except CartoError as e:
+        if e.log:
+            logger.error(e.message)
+        job["status"] = "error"
+        job["error"] = e.message
+    except Exception as e:
+        logger.error(f"Error: {str(e)}\nTraceback:\n{traceback.format_exc()}")
+        job["status"] = "error"
+        job["error"] = "Unknown error."
+
+    del job["data"]
+    redis_conn.set(job_key, json.dumps(job), ex=settings.CARTOGRAM_JOB_TTL)
+
+
+def run_worker() -> None:
+    from web import create_app
+
+    app = create_app()
+    work(app.logger)
+
+
+if __name__ == "__main__":
+    workers = [
+        multiprocessing.Process(target=run_worker)
+        for _ in range(settings.CARTOGRAM_JOB_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,43 @@
+import redis
+import settings
+
+# One pool per process, shared by progress tracking, the rate limiter, and job queue.
+# redis-py pools check the process id before handing out connections and discard
+# connections inherited from the parent, so the pool is safe to use after fork.
+pool = redis.BlockingConnectionPool(
+    host=settings.CARTOGRAM_REDIS_HOST,
+    port=settings.CARTOGRAM_REDIS_PORT,
+    db=0,
+    max_connections=settings.CARTOGRAM_REDIS_MAX_CONNECTIONS,
+    timeout=settings.CARTOGRAM_REDIS_SOCKET_TIMEOUT,
+    health_check_interval=settings.CARTOGRAM_REDIS_HEALTH_CHECK_INTERVAL,
+    socket_timeout=settings.CARTOGRAM_REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.CARTOGRAM_REDIS_CONNECT_TIMEOUT,
+)
+
+
+def get_connection() -> redis.Redis:
+    """
+    Get a Redis client that borrows connections from the shared pool.
+
+    Returns:
+        redis.Redis: Redis client
+    """
+    return redis.Redis(connection_pool=pool)
+
+
+def get_pool_stats() -> dict[str, int]:
+    """
+    Get the utilisation of the shared pool in this process.
+
+    Returns:
+        dict: max_connections, created (open connections), in_use, and available connections
+    """
+    created = len(pool._connections)
+    available = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "in_use": created - available,
+        "available": available,
+    }
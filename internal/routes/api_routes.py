@@ -1,21 +1,19 @@
-import datetime
 import json
 import traceback
 import warnings
 
+import jobs
+import redis_pool
 import settings
-from carto import boundary, parser, project
+from carto import boundary, parser
 from carto.progress import CartoProgress
-from carto.storage import CartoStorage
 from errors import CartoError
-from flask import Blueprint, Response, current_app, request
+from flask import Blueprint, Response, current_app, request, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from models import CartogramEntry
 from views import custom_captcha, tracking
 
 api_bp = Blueprint("api", __name__)
-db = current_app.extensions["sqlalchemy"]
 
 limiter = Limiter(
     get_remote_address,
@@ -24,6 +22,7 @@ limiter = Limiter(
     storage_uri="redis://{}:{}".format(
         settings.CARTOGRAM_REDIS_HOST, settings.CARTOGRAM_REDIS_PORT
     ),
+    storage_options={"connection_pool": redis_pool.pool},
 )
 
 
@@ -64,6 +63,21 @@ def getprogress():
     )
 
 
+@api_bp.route("/api/v1/getprogress/stream", methods=["GET"])
+@limiter.exempt
+def getprogress_stream():
+    if not settings.CARTOGRAM_PROGRESS_STREAM:
+        return Response("Not found", status=404)
+
+    progress = CartoProgress(request.args["key"])
+    return Response(
+        stream_with_context(progress.stream()),
+        status=200,
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api_bp.route("/api/v1/cartogram/preprocess/<mapDBKey>", methods=["POST"])
 def cartogram_preprocess(mapDBKey):
     if "file" not in request.files or request.files["file"].filename == "":
@@ -108,54 +122,31 @@ def cartogram_rate_limit():
 @limiter.limit(cartogram_rate_limit)
 def cartogram_gen():
     data = request.get_json()
-    handler_name, string_key, vis_types, datacsv, edit_from = parser.parse_project(data)
-    clean_by = data.get("geojsonRegionCol", "Region")
-
-    current_app.logger.info(f"Generating cartogram for {string_key}")
-
-    # Prepare data.csv and Input.json in userdata
-    storage = CartoStorage(string_key)
-    storage.save_tmp("data.csv", datacsv)
-    gen_file = storage.standardize_tmp_input(handler_name, edit_from)
-
-    warning_msgs = project.generate(
-        datacsv,
-        vis_types,
-        gen_file,
-        string_key,
-        storage.tmp_path,
-        clean_by=clean_by,
-    )
 
-    current_app.logger.info(f"Finish cartogram generation for {string_key}")
-
-    try:
-        if "persist" in data:
-            storage.persist(handler_name)
-
-            if settings.USE_DATABASE:
-                new_cartogram_entry = CartogramEntry(
-                    string_key=string_key,
-                    date_created=datetime.datetime.today(),
-                    date_accessed=datetime.datetime.now(datetime.UTC)
-                    - datetime.timedelta(days=365),
-                    handler=handler_name,
-                    title=data.get("title"),
-                    scheme=data.get("scheme"),
-                    types=json.dumps(vis_types),
-                    settings=json.dumps(data.get("settings")),
-                )
-                db.session.add(new_cartogram_entry)
-                db.session.commit()
-        else:
-            string_key = None
+    # Generate in a job worker, the client polls the job status with the returned id
+    if data.get("async"):
+        job_id = jobs.enqueue(data)
+        return Response(
+            json.dumps({"jobId": job_id}),
+            status=202,
+            content_type="application/json",
+        )
 
-    except Exception:
-        db.session.rollback()
-        raise
+    result = jobs.generate(data, current_app.logger)
 
     return Response(
-        json.dumps({"mapDBKey": string_key, "warnings": warning_msgs}),
+        json.dumps(result),
         status=200,
         content_type="application/json",
     )
+
+
+@api_bp.route("/api/v1/cartogram/job/<job_id>", methods=["GET"])
+@limiter.exempt
+def cartogram_job(job_id):
+    status = jobs.get_status(job_id)
+    return Response(
+        json.dumps(status),
+        status=200 if status["status"] is not None else 404,
+        content_type="application/json",
+    )
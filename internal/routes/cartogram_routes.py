@@ -132,6 +132,7 @@ def create_cartogram():
         page_active="maker",
         maps=handlers.get_sorted_handler_names(),
         count_limit=settings.CARTOGRAM_COUNT_LIMIT,
+        progress_stream=settings.CARTOGRAM_PROGRESS_STREAM,
         tracking=tracking.determine_tracking_action(request),
     )
 
@@ -197,9 +198,11 @@ def edit_cartogram(store_type, name_or_key):
         page_active="maker",
         maps=handlers.get_sorted_handler_names(),
         count_limit=settings.CARTOGRAM_COUNT_LIMIT,
+        progress_stream=settings.CARTOGRAM_PROGRESS_STREAM,
         map_name=handler_name,
         geo_url=geo_url,
         csv_url=csv_url,
+        edited_key=name_or_key if store_type == "key" else "",
         map_title=title,
         map_color_scheme=scheme,
         map_types=map_types,
@@ -1,9 +1,13 @@
 import datetime
+import json
 import os
 import shutil
 
 import handlers
+import redis_pool
 import settings
+from carto import admission
+from carto.cache import CartoCache
 from database import db
 from flask import Blueprint, Response, redirect, render_template
 from utils import file_utils
@@ -40,7 +44,8 @@ def cleanup():
     num_folders = 0
     tmp_folder_list = os.listdir(file_utils.get_safepath("tmp"))
     for file in tmp_folder_list:
-        if file == ".gitignore":
+        # The cache folder has its own size-based eviction
+        if file == ".gitignore" or file == "cache":
             continue
 
         file_path = file_utils.get_safepath("tmp", file)
@@ -61,6 +66,26 @@ def cleanup():
     return f"Removed records older than {year_ago.strftime('%d %B %Y - %H:%M:%S')} ({num_records} records). Removed {num_files} files and {num_folders} folders that are older than 1 day."
 
 
+@maintenance_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(
+        json.dumps(
+            {
+                "redis_pool": redis_pool.get_pool_stats(),
+                "cache": {
+                    "cpp": CartoCache("cpp").stats(),
+                    "equal_area": CartoCache("equal_area").stats(),
+                    "adjacency": CartoCache("adjacency").stats(),
+                    "validity": CartoCache("validity").stats(),
+                },
+                "admission": admission.get_stats(),
+            }
+        ),
+        status=200,
+        content_type="application/json",
+    )
+
+
 @maintenance_bp.route(
     "/embed/map/<map_name>", methods=["GET"], defaults={"mode": "embed"}
 )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 VITE_SERVER_PORT = os.environ.get("VITE_SERVER_PORT")
 
@@ -21,6 +22,106 @@ CARTOGRAM_TIME_LIMIT = os.environ.get("CARTOGRAM_TIME_LIMIT", None)
 if CARTOGRAM_TIME_LIMIT and not CARTOGRAM_TIME_LIMIT.isdigit():
     CARTOGRAM_TIME_LIMIT = None
 
+# Number of contiguous cartograms generated at the same time for one request
+try:
+    CARTOGRAM_REQUEST_WORKERS = max(
+        1, int(os.environ.get("CARTOGRAM_REQUEST_WORKERS", "4"))
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_REQUEST_WORKERS = 4
+
+# Number of cartogram binaries allowed to run at the same time on this host (0 = no limit)
+try:
+    CARTOGRAM_HOST_WORKERS = max(
+        0, int(os.environ.get("CARTOGRAM_HOST_WORKERS", str(os.cpu_count() or 1)))
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_HOST_WORKERS = os.cpu_count() or 1
+
+# Number of cartogram binaries allowed to wait for a slot on this host (0 = no limit),
+# and the longest wait in seconds (0 = no limit); other runs are rejected as busy.
+# The wait is at least as long as a binary may run (300 seconds, see
+# cpp_wrapper.execute), so the columns of a request do not time out waiting for
+# each other.
+try:
+    CARTOGRAM_HOST_QUEUE = max(
+        0, int(os.environ.get("CARTOGRAM_HOST_QUEUE", str(4 * CARTOGRAM_HOST_WORKERS)))
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_HOST_QUEUE = 4 * CARTOGRAM_HOST_WORKERS
+
+try:
+    CARTOGRAM_HOST_QUEUE_TIMEOUT = float(
+        os.environ.get("CARTOGRAM_HOST_QUEUE_TIMEOUT", "300")
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_HOST_QUEUE_TIMEOUT = 300
+
+# Number of cartogram binaries allowed to run at the same time on all hosts sharing
+# the Redis server (0 = no limit), and how long a slot is held at most in seconds
+try:
+    CARTOGRAM_CLUSTER_WORKERS = max(
+        0, int(os.environ.get("CARTOGRAM_CLUSTER_WORKERS", "0"))
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_CLUSTER_WORKERS = 0
+
+try:
+    CARTOGRAM_CLUSTER_LEASE = int(os.environ.get("CARTOGRAM_CLUSTER_LEASE", "600"))
+except (TypeError, ValueError):
+    CARTOGRAM_CLUSTER_LEASE = 600
+
+CARTOGRAM_LOCK_DIR = os.environ.get(
+    "CARTOGRAM_LOCK_DIR", os.path.join(tempfile.gettempdir(), "cartogram-locks")
+)
+
+# Resource limits of each cartogram binary run: CPU seconds and memory in MB (0 = no limit)
+try:
+    CARTOGRAM_CPU_LIMIT = max(0, int(os.environ.get("CARTOGRAM_CPU_LIMIT", "0")))
+except (TypeError, ValueError):
+    CARTOGRAM_CPU_LIMIT = 0
+
+try:
+    CARTOGRAM_MEMORY_LIMIT = (
+        max(0, int(os.environ.get("CARTOGRAM_MEMORY_LIMIT", "0"))) * 10**6
+    )
+except (TypeError, ValueError):
+    CARTOGRAM_MEMORY_LIMIT = 0
+
+# Niceness of cartogram binaries, so they do not slow down web requests
+try:
+    CARTOGRAM_NICE = int(os.environ.get("CARTOGRAM_NICE", "5"))
+except (TypeError, ValueError):
+    CARTOGRAM_NICE = 5
+
+# CPUs cartogram binaries may run on, e.g. "2,3" or "2-7" (empty = any CPU)
+try:
+    CARTOGRAM_CPU_AFFINITY = {
+        cpu
+        for part in os.environ.get("CARTOGRAM_CPU_AFFINITY", "").split(",")
+        if part.strip()
+        for cpu in (
+            range(int(part.split("-")[0]), int(part.split("-")[1]) + 1)
+            if "-" in part
+            else [int(part)]
+        )
+    }
+except (TypeError, ValueError):
+    CARTOGRAM_CPU_AFFINITY = set()
+
+# Seconds to wait after SIGTERM before a cartogram binary is killed with SIGKILL
+try:
+    CARTOGRAM_KILL_GRACE = float(os.environ.get("CARTOGRAM_KILL_GRACE", "5"))
+except (TypeError, ValueError):
+    CARTOGRAM_KILL_GRACE = 5
+
+# Cache of cartogram results, relative to the internal folder (size in MB, 0 = disabled)
+CARTOGRAM_CACHE_DIR = os.environ.get("CARTOGRAM_CACHE_DIR", "tmp/cache")
+try:
+    CARTOGRAM_CACHE_SIZE = int(os.environ.get("CARTOGRAM_CACHE_SIZE", "512")) * 10**6
+except (TypeError, ValueError):
+    CARTOGRAM_CACHE_SIZE = 512 * 10**6
+
 if "CARTOGRAM_DATABASE_URI" in os.environ:
     DATABASE_URI = os.environ.get("CARTOGRAM_DATABASE_URI", None)
     USE_DATABASE = True
@@ -34,6 +135,50 @@ else:
 
 CARTOGRAM_REDIS_HOST = os.environ.get("CARTOGRAM_REDIS_HOST", "redis")
 CARTOGRAM_REDIS_PORT = int(os.environ.get("CARTOGRAM_REDIS_PORT", 6379))
+CARTOGRAM_REDIS_MAX_CONNECTIONS = int(
+    os.environ.get("CARTOGRAM_REDIS_MAX_CONNECTIONS", "50")
+)
+CARTOGRAM_REDIS_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get("CARTOGRAM_REDIS_HEALTH_CHECK_INTERVAL", "30")
+)
+CARTOGRAM_REDIS_SOCKET_TIMEOUT = float(
+    os.environ.get("CARTOGRAM_REDIS_SOCKET_TIMEOUT", "5")
+)
+CARTOGRAM_REDIS_CONNECT_TIMEOUT = float(
+    os.environ.get("CARTOGRAM_REDIS_CONNECT_TIMEOUT", "2")
+)
+
+# Write .gz/.br copies of generated GeoJSON files to be served with Content-Encoding
+CARTOGRAM_PRECOMPRESS = (
+    os.environ.get("CARTOGRAM_PRECOMPRESS", "true").lower() == "true"
+)
+
+# Round output coordinates to at least this many steps across the map extent (0 = keep full precision)
+try:
+    CARTOGRAM_QUANTIZATION = int(os.environ.get("CARTOGRAM_QUANTIZATION", "0"))
+except (TypeError, ValueError):
+    CARTOGRAM_QUANTIZATION = 0
+
+# Maximum number of progress updates per second sent to Redis for each generation
+CARTOGRAM_PROGRESS_RATE = float(os.environ.get("CARTOGRAM_PROGRESS_RATE", "4"))
+
+# Stream progress to the maker with server-sent events instead of polling. Each stream
+# holds a web worker, so only enable it with a threaded or async Gunicorn worker class
+CARTOGRAM_PROGRESS_STREAM = (
+    os.environ.get("CARTOGRAM_PROGRESS_STREAM", "false").lower() == "true"
+)
+
+# Maximum number of seconds a progress stream holds a web worker before the client reconnects
+CARTOGRAM_PROGRESS_STREAM_TIME = float(
+    os.environ.get("CARTOGRAM_PROGRESS_STREAM_TIME", "20")
+)
+
+# Job queue for asynchronous cartogram generation (see jobs.py)
+CARTOGRAM_JOB_WORKERS = int(os.environ.get("CARTOGRAM_JOB_WORKERS", "2"))
+CARTOGRAM_JOB_TTL = int(os.environ.get("CARTOGRAM_JOB_TTL", "3600"))
+# Seconds after which a job still being generated is considered lost by its worker and
+# queued again, longer than any generation takes
+CARTOGRAM_JOB_LEASE = int(os.environ.get("CARTOGRAM_JOB_LEASE", "1800"))
 
 SMTP_HOST = os.environ.get("CARTOGRAM_SMTP_HOST", "")
 SMTP_PORT = int(os.environ.get("CARTOGRAM_SMTP_PORT", 2525))
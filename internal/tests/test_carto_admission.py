@@ -0,0 +1,67 @@
+import fcntl
+
+import pytest
+from carto import admission
+from errors import CartoBusyError
+
+
+@pytest.fixture
+def one_slot(mocker, tmp_path):
+    mocker.patch("settings.CARTOGRAM_LOCK_DIR", str(tmp_path))
+    mocker.patch("settings.CARTOGRAM_HOST_WORKERS", 1)
+    mocker.patch("settings.CARTOGRAM_CLUSTER_WORKERS", 0)
+    mocker.patch("settings.CARTOGRAM_HOST_QUEUE", 1)
+    mocker.patch("settings.CARTOGRAM_HOST_QUEUE_TIMEOUT", 0.3)
+
+
+def test_host_slot_is_exclusive(one_slot):
+    with admission.host_slot() as index:
+        assert index == 0
+        assert admission.get_stats()["running"] == 1
+
+        # The only place in the queue is taken by the waiting run, which times out
+        with (
+            pytest.raises(CartoBusyError) as error,
+            admission.host_slot(poll_interval=0.05),
+        ):
+            pass
+
+    assert error.value.retry_after >= 1
+    assert admission.get_stats()["running"] == 0
+    assert admission.get_stats()["waiting"] == 0
+
+
+def test_host_slot_rejects_when_queue_is_full(one_slot, mocker):
+    mocker.patch("settings.CARTOGRAM_HOST_QUEUE_TIMEOUT", 0)
+    rejected = admission.get_stats()["rejected"]
+
+    with admission.host_slot():
+        ticket = admission._enter_queue()
+        try:
+            with pytest.raises(CartoBusyError), admission.host_slot():
+                pass
+        finally:
+            admission._leave_queue(ticket, 0)
+
+    assert admission.get_stats()["rejected"] == rejected + 1
+
+
+def test_busy_error_response():
+    response = CartoBusyError(retry_after=7).response()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_counting_does_not_lock_slots(one_slot, mocker):
+    flock = mocker.spy(fcntl, "flock")
+
+    with admission.host_slot():
+        flock.reset_mock()
+        assert admission.get_stats()["running"] == 1
+        locked_files = [call.args[0].name for call in flock.call_args_list]
+
+    # Only the markers are probed, so a free slot is never seen as taken
+    assert locked_files
+    assert all(name.endswith(".held") for name in locked_files)
+    assert admission.get_stats()["running"] == 0
@@ -0,0 +1,80 @@
+import os
+import shutil
+import time
+
+from carto import boundary
+from carto.cache import CartoCache
+from carto.dataframe import CartoDataFrame
+from utils import file_utils
+
+
+def test_cache_lru_eviction():
+    cache = CartoCache("test_lru", max_size=10)
+    shutil.rmtree(cache.cache_path, ignore_errors=True)
+
+    try:
+        cache.set("a", b"12345")
+        time.sleep(0.01)
+        cache.set("b", b"12345")
+        time.sleep(0.01)
+        assert cache.get("a") == b"12345"
+
+        # "b" is the least recently used entry
+        cache.set("c", b"12345")
+        assert cache.get("b") is None
+        assert cache.get("a") == b"12345"
+        assert cache.get("c") == b"12345"
+
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert stats["size"] == 10
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+    finally:
+        shutil.rmtree(cache.cache_path, ignore_errors=True)
+
+
+def test_cache_key_depends_on_part_boundaries():
+    assert CartoCache.make_key("ab", "c") != CartoCache.make_key("a", "bc")
+    assert CartoCache.make_key("ab", "c") == CartoCache.make_key(b"ab", b"c")
+
+
+def test_equal_area_is_cached(mocker):
+    mocker.patch("settings.CARTOGRAM_CACHE_DIR", "tmp/test_equal_area_cache")
+    cache_path = file_utils.get_safepath("tmp/test_equal_area_cache")
+    work_path = file_utils.get_safepath("tmp/test_equal_area")
+    os.makedirs(work_path, exist_ok=True)
+    input_path = os.path.join(work_path, "Input.json")
+
+    cdf = CartoDataFrame.from_json_obj(
+        {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"Region": "A"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]],
+                    },
+                }
+            ],
+        }
+    )
+    # The cache key covers the binary, which may not be installed
+    mocker.patch("carto.generators.cpp_wrapper.get_binary_path", return_value=__file__)
+    run_binary = mocker.patch(
+        "carto.boundary.run_binary", return_value=cdf.to_json_obj()
+    )
+
+    try:
+        first = boundary.generate_equal_area(cdf, input_path)
+        second = boundary.generate_equal_area(cdf, input_path)
+
+        run_binary.assert_called_once()
+        assert run_binary.call_args.kwargs["cached"] is False
+        assert second.json_data == first.json_data
+        assert second.geoms_info == first.geoms_info
+    finally:
+        shutil.rmtree(cache_path, ignore_errors=True)
+        shutil.rmtree(work_path, ignore_errors=True)
@@ -1,6 +1,14 @@
 import json
+import os
+import shutil
 
+import geopandas as gpd
+import pytest
+from carto.cache import CartoCache
 from carto.dataframe import CartoDataFrame
+from errors import CartoError
+from shapely.geometry import MultiPolygon, box
+from utils import file_utils
 
 
 # Successfully reads valid GeoJSON file and creates CartoDataFrame instance
@@ -58,3 +66,145 @@ def test_clean_properties_with_other_region_column(test_data_dir):
     assert "Region" in carto_json["features"][0]["properties"]
     assert "99" == carto_json["features"][0]["properties"]["Region"]
     assert "prop_non_unique" not in carto_json["features"][0]["properties"]
+
+
+def test_read_file_columns(test_data_dir):
+    geojson_file = test_data_dir / "usa_by_state_since_1959.geojson"
+    carto_df = CartoDataFrame.read_file(str(geojson_file), columns=["State", "Missing"])
+
+    assert carto_df.columns.tolist() == ["State", "geometry"]
+    assert carto_df.crs == "EPSG:4326"
+
+
+# Polygons are converted directly, other geometries through GeoPandas
+@pytest.mark.parametrize(
+    "filename", ["usa_by_state_since_1959.geojson", "geojson_test.geojson"]
+)
+def test_to_carto_file(test_data_dir, filename):
+    carto_df = CartoDataFrame.read_file(str(test_data_dir / filename))
+    carto_df["Missing"] = [None, float("nan")] + [1.5] * (len(carto_df) - 2)
+    carto_df[7] = range(len(carto_df))
+    filepath = file_utils.get_safepath("tmp", "test_to_carto_file.json")
+
+    try:
+        output_data = carto_df.to_carto_file(filepath)
+        with open(filepath) as f:
+            written = json.load(f)
+    finally:
+        os.remove(filepath)
+
+    # Same as the features written by GeoPandas
+    expected = {
+        "type": "FeatureCollection",
+        **carto_df.extra_attributes,
+        "features": json.loads(gpd.GeoDataFrame.to_json(carto_df))["features"],
+    }
+    assert written == expected
+    assert json.loads(json.dumps(output_data)) == expected
+    assert written["features"][0]["properties"]["Missing"] is None
+    assert written["features"][1]["properties"]["Missing"] is None
+    assert written["features"][1]["properties"]["7"] == 1
+
+
+def test_to_json_obj_polygons():
+    carto_df = CartoDataFrame(
+        {
+            "Region": ["A", None],
+            "Value": [1.0, float("nan")],
+            2.5: [True, False],
+            "geometry": [
+                box(0, 0, 1, 1),
+                MultiPolygon(
+                    [
+                        box(2, 0, 3, 1),
+                        box(4, 0, 5, 1).difference(box(4.2, 0.2, 4.8, 0.8)),
+                    ]
+                ),
+            ],
+        }
+    )
+
+    assert carto_df.to_json_obj() == {
+        "type": "FeatureCollection",
+        "features": json.loads(gpd.GeoDataFrame.to_json(carto_df))["features"],
+    }
+
+
+def _write_bowties(filename, count):
+    # A bowtie polygon crosses itself, so it is not simple
+    bowtie = [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]
+    square = [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"Region": str(i)},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": bowtie if i % 2 else square,
+            },
+        }
+        for i in range(count)
+    ]
+
+    filepath = file_utils.get_safepath("tmp", filename)
+    with open(filepath, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return filepath
+
+
+def test_read_file_lists_non_simple_features(mocker):
+    mocker.patch("settings.CARTOGRAM_CACHE_SIZE", 0)
+    filepath = _write_bowties("test_non_simple.geojson", 24)
+
+    try:
+        with pytest.raises(CartoError) as exc_info:
+            CartoDataFrame.read_file(filepath)
+
+        carto_df = CartoDataFrame.read_file(filepath, trusted=True)
+    finally:
+        os.remove(filepath)
+
+    assert "12 feature(s)" in exc_info.value.message
+    assert "(at index 1, 3, 5, 7, 9, 11, 13, 15, 17, 19, ...)" in exc_info.value.message
+    assert len(carto_df) == 24
+
+
+def test_validity_is_cached(mocker):
+    mocker.patch("settings.CARTOGRAM_CACHE_DIR", "tmp/test_validity_cache")
+    filepath = _write_bowties("test_validity.geojson", 3)
+
+    try:
+        with pytest.raises(CartoError, match="at index 1"):
+            CartoDataFrame.read_file(filepath)
+
+        # The second read of the same content uses the cached result
+        is_simple = mocker.patch.object(
+            gpd.GeoDataFrame, "is_simple", new_callable=mocker.PropertyMock
+        )
+        with pytest.raises(CartoError, match="at index 1"):
+            CartoDataFrame.read_file(filepath)
+    finally:
+        os.remove(filepath)
+        shutil.rmtree(
+            file_utils.get_safepath("tmp/test_validity_cache"), ignore_errors=True
+        )
+
+    is_simple.assert_not_called()
+
+
+def test_validity_uses_given_hash(mocker):
+    mocker.patch("settings.CARTOGRAM_CACHE_DIR", "tmp/test_validity_cache")
+    hash_file = mocker.spy(CartoCache, "hash_file")
+    filepath = _write_bowties("test_validity_hash.geojson", 3)
+
+    try:
+        with pytest.raises(CartoError, match="at index 1"):
+            CartoDataFrame.read_file(filepath, file_hash=CartoCache.hash_file(filepath))
+    finally:
+        os.remove(filepath)
+        shutil.rmtree(
+            file_utils.get_safepath("tmp/test_validity_cache"), ignore_errors=True
+        )
+
+    # Only hashed by the caller
+    assert hash_file.call_count == 1
@@ -0,0 +1,65 @@
+import shutil
+
+import geopandas as gpd
+import numpy as np
+from carto import mapcolor
+from shapely.geometry import box
+from utils import file_utils
+
+
+def _grid(size):
+    return gpd.GeoDataFrame(
+        geometry=[box(x, y, x + 1, y + 1) for y in range(size) for x in range(size)]
+    )
+
+
+def test_adjacency_is_rook():
+    adjacency = mapcolor.get_adjacency(_grid(3).geometry.values)
+
+    # The center square shares a border with 4 squares, not with the corners
+    neighbours = adjacency.indices[adjacency.indptr[4] : adjacency.indptr[5]]
+    assert sorted(neighbours) == [1, 3, 5, 7]
+    assert (adjacency != adjacency.T).nnz == 0
+
+
+def test_colors_are_proper_and_balanced():
+    gdf = _grid(12)
+    colors = np.asarray(mapcolor.assign_colors(gdf))
+    adjacency = mapcolor.get_adjacency(gdf.geometry.values).tocoo()
+
+    assert not (colors[adjacency.row] == colors[adjacency.col]).any()
+    assert np.bincount(colors).tolist() == [24] * mapcolor.COLOR_COUNT
+
+
+def test_falls_back_to_gcol(mocker):
+    mocker.patch("carto.mapcolor.color_graph", return_value=None)
+    gcol = mocker.patch("carto.mapcolor._assign_colors_gcol")
+
+    mapcolor.assign_colors(_grid(2))
+
+    gcol.assert_called_once()
+
+
+def test_adjacency_is_cached(mocker):
+    mocker.patch("settings.CARTOGRAM_CACHE_DIR", "tmp/test_adjacency_cache")
+    get_adjacency = mocker.spy(mapcolor, "get_adjacency")
+    geometries = _grid(3).geometry.values
+
+    try:
+        first = mapcolor.load_adjacency(geometries, "grid")
+        second = mapcolor.load_adjacency(geometries, "grid")
+    finally:
+        shutil.rmtree(
+            file_utils.get_safepath("tmp/test_adjacency_cache"), ignore_errors=True
+        )
+
+    get_adjacency.assert_called_once()
+    assert (first != second).nnz == 0
+
+
+def test_adjacency_is_not_cached_without_key(mocker):
+    cache_set = mocker.patch("carto.cache.CartoCache.set")
+
+    mapcolor.load_adjacency(_grid(3).geometry.values)
+
+    cache_set.assert_not_called()
@@ -0,0 +1,154 @@
+import json
+import time
+
+from carto.progress import CartoProgress
+
+
+class FakeRedis:
+    def __init__(self, *args, **kwargs):
+        self.data = {}
+        self.published = []
+        #: Messages received by progress streams, None for a wait without message
+        self.published_messages = []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def pubsub(self, **kwargs):
+        self.pubsub_client = FakePubSub(self.published_messages)
+        return self.pubsub_client
+
+    def register_script(self, script):
+        # Same logic as carto.progress.UPDATE_SCRIPT
+        def update(keys, args):
+            current = self.data.get(keys[0])
+            if current is not None and json.loads(current)["order"] >= args[1]:
+                return 0
+
+            self.data[keys[0]] = args[0].encode()
+            self.published.append(json.loads(args[3]))
+            return 1
+
+        return update
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.closed = False
+
+    def subscribe(self, channel):
+        pass
+
+    def get_message(self, timeout):
+        if not self.messages:
+            time.sleep(timeout)
+            return None
+
+        data = self.messages.pop(0)
+        if data is None:
+            return None
+        return {"data": json.dumps(data).encode()}
+
+    def close(self):
+        self.closed = True
+
+
+def test_progress_with_concurrent_columns(mocker):
+    mocker.patch("redis_pool.get_connection", FakeRedis)
+    mocker.patch("settings.CARTOGRAM_PROGRESS_RATE", 0)
+    progress = CartoProgress("test")
+    progress.setData(["A", "B"])
+
+    progress.start("A")
+    progress.start("B")
+    progress.set("", "A", 0.5)
+    progress.set("", "B", 0.5)
+    assert progress.get()["progress"] == 0.5
+
+    progress.set("", "B", 1)
+    assert progress.get()["progress"] == 0.75
+    assert progress.get()["name"] == "B"
+
+    progress.set("", "A", 1)
+    assert progress.get()["progress"] == 1
+
+
+def test_progress_throttle_keeps_final_update(mocker):
+    mocker.patch("redis_pool.get_connection", FakeRedis)
+    mocker.patch("settings.CARTOGRAM_PROGRESS_RATE", 1)
+    progress = CartoProgress("test")
+    progress.setData(["A"])
+
+    progress.start("A")
+    for i in range(1, 10):
+        progress.set("", "A", i / 10)
+    progress.set("", "A", 1)
+
+    published = progress.redis_conn.published
+    assert len(published) == 2
+    assert published[0]["progress"] == 0
+    assert published[-1]["progress"] == 1
+    assert progress.get()["progress"] == 1
+
+
+def _progress(value):
+    return {"stderr": "", "name": "A", "progress": value}
+
+
+def test_stream_sends_keepalive_and_done_event(mocker):
+    mocker.patch("redis_pool.get_connection", FakeRedis)
+    progress = CartoProgress("test")
+    progress.redis_conn.published_messages = [None, _progress(0.5), _progress(1)]
+
+    events = list(progress.stream(timeout=30))
+
+    assert events == [
+        "retry: 1000\n\n",
+        'data: {"progress": null, "stderr": ""}\n\n',
+        ": keepalive\n\n",
+        f"data: {json.dumps(_progress(0.5))}\n\n",
+        f"event: done\ndata: {json.dumps(_progress(1))}\n\n",
+    ]
+    assert progress.redis_conn.pubsub_client.closed
+
+
+def test_stream_ends_with_done_event_if_finished(mocker):
+    mocker.patch("redis_pool.get_connection", FakeRedis)
+    mocker.patch("settings.CARTOGRAM_PROGRESS_RATE", 0)
+    progress = CartoProgress("test")
+    progress.set("", "A", 1)
+
+    events = list(progress.stream(timeout=30))
+
+    assert events[-1].startswith("event: done\n")
+    assert len(events) == 2
+
+
+def test_stream_ends_after_timeout(mocker):
+    mocker.patch("redis_pool.get_connection", FakeRedis)
+    progress = CartoProgress("test")
+
+    start = time.monotonic()
+    events = list(progress.stream(timeout=0.2, keepalive=0.05))
+
+    assert time.monotonic() - start < 1
+    assert events[2:] and set(events[2:]) == {": keepalive\n\n"}
+    assert not any(event.startswith("event: done") for event in events)
+    assert progress.redis_conn.pubsub_client.closed
+
+
+def test_progress_of_retried_generation_replaces_earlier_attempt(mocker):
+    mocker.patch("redis_pool.get_connection", return_value=FakeRedis())
+    mocker.patch("settings.CARTOGRAM_PROGRESS_RATE", 0)
+    first = CartoProgress("test")
+    first.setData(["A"])
+    for i in range(5):
+        first.set("", "A", i / 10)
+
+    # A new attempt, e.g. on another worker, starts from the beginning
+    retry = CartoProgress("test")
+    retry.setData(["A"])
+    retry.start("A")
+
+    assert retry.get()["progress"] == 0
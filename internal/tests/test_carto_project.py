@@ -0,0 +1,229 @@
+import io
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from carto import fingerprints, project
+from carto.datacsv import CartoCsv
+from carto.dataframe import CartoDataFrame
+from utils import file_utils
+
+HANDLER = "usa_by_state_since_1959"
+VIS_TYPES = {"Population (people)": "contiguous"}
+
+
+@pytest.fixture
+def project_path():
+    path = file_utils.get_safepath("tmp", "test_carto_project")
+    os.makedirs(path, exist_ok=True)
+    yield path
+    shutil.rmtree(path)
+
+
+def _handler_csv():
+    with open(file_utils.get_safepath("static/cartdata", HANDLER, "data.csv")) as f:
+        return f.read()
+
+
+def _gen_file():
+    return file_utils.get_safepath("static/cartdata", HANDLER, "Input.json")
+
+
+def test_unchanged_handler_data_reuses_cartograms(mocker, project_path):
+    mocker.patch("settings.CARTOGRAM_PRECOMPRESS", False)
+    progress = mocker.patch("carto.project.CartoProgress").return_value
+    generate_equal_area = mocker.patch("carto.boundary.generate_equal_area")
+
+    # Colors do not change the cartograms
+    csv_string = _handler_csv().replace(",3,C,", ",2,C,")
+    input_file = os.path.join(project_path, "Input.json")
+    shutil.copy(_gen_file(), input_file)
+    warnings = project.generate(
+        csv_string,
+        VIS_TYPES,
+        input_file,
+        "test_carto_project",
+        project_path,
+        clean_by="Region",
+        handler_name=HANDLER,
+    )
+
+    assert warnings == []
+    generate_equal_area.assert_not_called()
+    for name in ["Geographic Area", "Population", "Population_simplified"]:
+        assert os.path.samefile(
+            os.path.join(project_path, f"{name}.json"),
+            file_utils.get_safepath("static/cartdata", HANDLER, f"{name}.json"),
+        )
+
+    # The linked outputs are reused by an edit of the project
+    output_fingerprints = fingerprints.get_fingerprints(
+        input_file, CartoCsv(csv_string, VIS_TYPES), VIS_TYPES, "Region", []
+    )
+    outputs = fingerprints.load(project_path)["outputs"]
+    assert {name: entry["fingerprint"] for name, entry in outputs.items()} == (
+        output_fingerprints
+    )
+    assert outputs["Population"]["files"] == [
+        "Population.json",
+        "Population_simplified.json",
+    ]
+
+    for data_col in CartoCsv(csv_string, VIS_TYPES).data_cols:
+        progress.set.assert_any_call("", data_col, 1)
+
+
+def test_changed_handler_data_is_generated(project_path):
+    lines = _handler_csv().splitlines()
+    lines[1] = lines[1].rsplit(",", 1)[0] + ",1"
+    datacsv = CartoCsv("\n".join(lines), VIS_TYPES)
+
+    assert not project._reuse_handler_outputs(HANDLER, datacsv, VIS_TYPES, project_path)
+    assert not os.path.exists(os.path.join(project_path, "Population.json"))
+
+
+def test_atomic_save_does_not_modify_linked_file(project_path):
+    source = os.path.join(project_path, "source.json")
+    with open(source, "w") as f:
+        f.write("{}")
+
+    destination = os.path.join(project_path, "destination.json")
+    file_utils.link_or_copy(source, destination)
+    file_utils.write_atomic(destination, b"[]")
+
+    with open(source) as f:
+        assert f.read() == "{}"
+
+
+def test_fingerprints_change_only_for_edited_column():
+    vis_types = {**VIS_TYPES, "Copy (people)": "noncontiguous"}
+    df = pd.read_csv(io.StringIO(_handler_csv()))
+    df["Copy (people)"] = df["Population (people)"]
+    before = fingerprints.get_fingerprints(
+        _gen_file(), CartoCsv(df.to_csv(index=False), vis_types), vis_types, None, []
+    )
+
+    df.loc[0, "Copy (people)"] += 1
+    after = fingerprints.get_fingerprints(
+        _gen_file(), CartoCsv(df.to_csv(index=False), vis_types), vis_types, None, []
+    )
+
+    assert before["Geographic Area"] == after["Geographic Area"]
+    assert before["Population"] == after["Population"]
+    assert before["Copy"] != after["Copy"]
+
+
+def test_fingerprints_change_with_binary(mocker):
+    datacsv = CartoCsv(_handler_csv(), VIS_TYPES)
+    before = fingerprints.get_fingerprints(_gen_file(), datacsv, VIS_TYPES, None, [])
+
+    # Outputs of an updated binary are not reused
+    mocker.patch("carto.fingerprints.get_binary_id", return_value="updated")
+    after = fingerprints.get_fingerprints(_gen_file(), datacsv, VIS_TYPES, None, [])
+
+    assert all(before[name] != after[name] for name in before)
+
+
+def test_unchanged_outputs_are_linked_from_source(project_path):
+    source_path = os.path.join(project_path, "source")
+    os.makedirs(source_path)
+    for name in ["A.json", "B.json"]:
+        with open(os.path.join(source_path, name), "w") as f:
+            f.write('{"bbox": [0, 0, 1, 1]}')
+
+    outputs = {
+        name: {"fingerprint": name, "bbox": [0, 0, 1, 1], "files": [f"{name}.json"]}
+        for name in ["A", "B"]
+    }
+    fingerprints.save(source_path, outputs, [0, 0, 1, 1])
+
+    reused = fingerprints.reuse(source_path, project_path, {"A": "A", "B": "changed"})
+
+    assert list(reused) == ["A"]
+    assert os.path.samefile(
+        os.path.join(project_path, "A.json"), os.path.join(source_path, "A.json")
+    )
+    assert not os.path.exists(os.path.join(project_path, "B.json"))
+
+    # A new shared bounding box replaces the link instead of modifying the source
+    fingerprints.set_bbox(project_path, "A.json", [0, 0, 2, 2])
+    with open(os.path.join(source_path, "A.json")) as f:
+        assert json.load(f)["bbox"] == [0, 0, 1, 1]
+
+
+def _fake_run_binary(
+    gen_path, area_data_path, data_name="", *args, usage=None, **kwargs
+):
+    with open(gen_path) as f:
+        geojson = json.load(f)
+
+    if usage is not None:
+        usage.update({"cpu_time": 1.0, "max_rss": 1e6})
+
+    if data_name == "Geographic Area":
+        return geojson
+    return {"Original": geojson, "Simplified": geojson}
+
+
+@pytest.mark.parametrize("handler_name", [None, HANDLER])
+def test_edited_project_reuses_unchanged_outputs(mocker, project_path, handler_name):
+    mocker.patch("settings.CARTOGRAM_CACHE_SIZE", 0)
+    mocker.patch("settings.CARTOGRAM_PRECOMPRESS", False)
+    mocker.patch("carto.project.CartoProgress")
+    mocker.patch("carto.boundary.run_binary", side_effect=_fake_run_binary)
+    run_binary = mocker.patch(
+        "carto.generators.generator_contiguous.run_binary",
+        side_effect=_fake_run_binary,
+    )
+    reuse = mocker.spy(fingerprints, "reuse")
+    to_carto_file = mocker.spy(CartoDataFrame, "to_carto_file")
+
+    vis_types = {**VIS_TYPES, "Copy (people)": "contiguous"}
+    df = pd.read_csv(io.StringIO(_handler_csv()))
+    df["Copy (people)"] = df["Population (people)"]
+
+    source_path = os.path.join(project_path, "source")
+    os.makedirs(source_path)
+    shutil.copy(_gen_file(), os.path.join(source_path, "Input.json"))
+    project.generate(
+        df.to_csv(index=False),
+        vis_types,
+        os.path.join(source_path, "Input.json"),
+        "test_carto_project",
+        source_path,
+        handler_name=handler_name,
+    )
+
+    # An edit starts from the boundary file saved with the source project, or from the
+    # boundary of the built-in map
+    edit_path = os.path.join(project_path, "edit")
+    os.makedirs(edit_path)
+    shutil.copy(
+        _gen_file() if handler_name else os.path.join(source_path, "Input.json"),
+        os.path.join(edit_path, "Input.json"),
+    )
+    df.loc[0, "Copy (people)"] += 1
+    run_binary.reset_mock()
+    usage = {}
+    project.generate(
+        df.to_csv(index=False),
+        vis_types,
+        os.path.join(edit_path, "Input.json"),
+        "test_carto_project",
+        edit_path,
+        handler_name=handler_name,
+        source_path=source_path,
+        usage=usage,
+    )
+
+    assert list(reuse.spy_return) == ["Geographic Area", "Population"]
+    # The boundary is written once by each generation
+    assert to_carto_file.call_count == 2
+    assert [call.args[2] for call in run_binary.call_args_list] == ["Copy (people)"]
+    assert list(usage) == ["Geographic Area", "Copy"]
+    assert os.path.samefile(
+        os.path.join(edit_path, "Population_simplified.json"),
+        os.path.join(source_path, "Population_simplified.json"),
+    )
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+from carto import limits
+from carto.generators import cpp_wrapper
+from errors import CartoError
+
+
+class FakeProgress:
+    def __init__(self):
+        self.updates = []
+
+    def set(self, stderr, name, progress):
+        self.updates.append((name, progress))
+
+
+def fake_execute(stdout, stderr_lines, chunk_size=7, usage=None):
+    def execute(*args, **kwargs):
+        for line in stderr_lines:
+            yield "stderr", line.encode()
+        for i in range(0, len(stdout), chunk_size):
+            yield "stdout", stdout[i : i + chunk_size]
+        if usage is not None:
+            yield "usage", usage
+
+    return execute
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_run_binary_parses_chunked_output(mocker, use_orjson):
+    if not use_orjson:
+        mocker.patch.object(cpp_wrapper, "orjson", None)
+
+    output = {"Original": {"type": "FeatureCollection", "features": []}, "x": 1.5}
+    mocker.patch.object(cpp_wrapper, "get_cache_key", return_value=None)
+    mocker.patch.object(
+        cpp_wrapper,
+        "execute",
+        fake_execute(
+            json.dumps(output).encode() + b"\n",
+            [
+                "Progress: 0.5\n",
+                "WARNING: Something is off\n",
+                "Max. area err: 0.02, GeoDiv: Alaska\n",
+                "Progress: 1\n",
+            ],
+        ),
+    )
+
+    progress = FakeProgress()
+    result = cpp_wrapper.run_binary("Input.json", None, "Population", [], progress)
+
+    assert result["Original"] == output["Original"]
+    assert result["x"] == 1.5
+    assert result["Warnings"][0] == "Population: Something is off"
+    assert "Alaska" in result["Warnings"][1]
+    assert progress.updates == [("Population", 0.5), ("Population", 1.0)]
+
+
+def test_run_binary_raises_binary_error(mocker):
+    mocker.patch.object(cpp_wrapper, "get_cache_key", return_value=None)
+    mocker.patch.object(
+        cpp_wrapper, "execute", fake_execute(b"", ["ERROR: Invalid input\n"])
+    )
+
+    with pytest.raises(CartoError, match="Invalid input"):
+        cpp_wrapper.run_binary("Input.json", None, "Population")
+
+
+def test_run_binary_without_output(mocker):
+    mocker.patch.object(cpp_wrapper, "get_cache_key", return_value=None)
+    mocker.patch.object(cpp_wrapper, "execute", fake_execute(b"\n", []))
+
+    assert cpp_wrapper.run_binary("Input.json", None, "Population") is None
+
+
+def test_run_binary_reports_usage(mocker):
+    binary_usage = {"cpu_time": 1.5, "max_rss": 2e6}
+    mocker.patch.object(cpp_wrapper, "get_cache_key", return_value=None)
+    mocker.patch.object(
+        cpp_wrapper, "execute", fake_execute(b"{}", [], usage=binary_usage)
+    )
+
+    usage = {}
+    cpp_wrapper.run_binary("Input.json", None, "Population", usage=usage)
+
+    assert usage == binary_usage
+
+
+def start_process(script):
+    return subprocess.Popen(
+        [sys.executable, "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        process_group=0,
+    )
+
+
+def test_read_output_splits_stderr_lines():
+    process = start_process(
+        "import sys\n"
+        "sys.stderr.write('Progress: 0.5\\nProg'); sys.stderr.flush()\n"
+        "sys.stdout.write('x' * 200000); sys.stdout.flush()\n"
+        "sys.stderr.write('ress: 1\\nlast')\n"
+    )
+
+    output = list(cpp_wrapper.read_output(process, timeout=30))
+    process.wait()
+
+    stderr = [data for source, data in output if source == "stderr"]
+    stdout = b"".join(data for source, data in output if source == "stdout")
+    assert stderr == [b"Progress: 0.5\n", b"Progress: 1\n", b"last"]
+    assert stdout == b"x" * 200000
+
+
+def test_read_output_terminates_after_timeout():
+    process = start_process(
+        "import sys, time\nprint('started', flush=True)\ntime.sleep(30)"
+    )
+
+    start = time.monotonic()
+    output = list(cpp_wrapper.read_output(process, timeout=0.5))
+
+    assert time.monotonic() - start < 10
+    assert b"".join(data for _, data in output) == b"started\n"
+    assert process.wait() != 0
+
+
+def test_read_output_kills_process_ignoring_sigterm(mocker):
+    mocker.patch("settings.CARTOGRAM_KILL_GRACE", 0.5)
+    process = start_process(
+        "import signal, time\n"
+        "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+        "print('started', flush=True)\n"
+        "time.sleep(30)"
+    )
+
+    start = time.monotonic()
+    list(cpp_wrapper.read_output(process, timeout=0.5))
+
+    assert time.monotonic() - start < 10
+    assert process.wait() == -signal.SIGKILL
+
+
+def test_wait_process_reports_usage():
+    process = start_process("x = bytearray(50 * 10**6)")
+    process.stdout.read()
+
+    usage = limits.wait_process(process, grace=5)
+
+    assert process.returncode == 0
+    assert usage["max_rss"] > 50 * 10**6
+    assert usage["cpu_time"] >= 0
+
+
+def make_async_run(mocker, script, timeout=30):
+    mocker.patch.object(cpp_wrapper, "get_binary_args", return_value=[])
+    run = cpp_wrapper.AsyncBinaryRun("Input.json", None, "Population", [], timeout)
+    run.args = [sys.executable, "-c", script]
+    return run
+
+
+def test_async_binary_run(mocker):
+    run = make_async_run(
+        mocker,
+        "import sys, json\n"
+        "for p in (0.5, 1): print(f'Progress: {p}', file=sys.stderr, flush=True)\n"
+        "print(json.dumps({'Original': [1] * 50000}))\n",
+    )
+
+    async def consume():
+        return [value async for value in run]
+
+    assert asyncio.run(consume()) == [0.5, 1.0]
+    assert run.result == {"Original": [1] * 50000}
+
+
+def test_async_binary_run_cancel_terminates_process(mocker):
+    run = make_async_run(
+        mocker,
+        "import os, sys, time\n"
+        "print(os.getpid(), file=sys.stderr, flush=True)\n"
+        "print('Progress: 0.1', file=sys.stderr, flush=True)\n"
+        "time.sleep(30)\n",
+    )
+
+    async def cancel_after_start():
+        started = asyncio.Event()
+
+        async def consume():
+            async for _ in run:
+                started.set()
+
+        task = asyncio.create_task(consume())
+        await started.wait()
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel_after_start())
+
+    pid = int(run.output.stderr.splitlines()[1])
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
@@ -1,3 +1,4 @@
+import gzip
 import os
 from pathlib import Path
 
@@ -29,3 +30,25 @@ def test_get_safepath_raises_error_for_invalid_path_prefix():
 
     # Verify the error message
     assert "Invalid file path" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("best", [False, True])
+def test_save_compressed(mocker, best):
+    brotli = pytest.importorskip("brotli")
+    compress = mocker.spy(brotli, "compress")
+    data = b'{"type": "FeatureCollection", "features": []}' * 100
+    filepath = file_utils.get_safepath("tmp", "test_save_compressed.json")
+
+    try:
+        file_utils.save_compressed(filepath, data, best=best)
+        with open(filepath + ".gz", "rb") as f:
+            gzipped = f.read()
+        with open(filepath + ".br", "rb") as f:
+            brotlied = f.read()
+    finally:
+        for suffix in (".gz", ".br"):
+            os.remove(filepath + suffix)
+
+    assert gzip.decompress(gzipped) == data
+    assert brotli.decompress(brotlied) == data
+    assert compress.call_args.kwargs["quality"] == (11 if best else 4)
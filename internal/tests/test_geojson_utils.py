@@ -0,0 +1,155 @@
+import json
+
+import numpy as np
+import pytest
+import shapely
+from carto.datajson import CartoJson
+from utils import geojson_utils
+
+
+def test_get_quantized_precision():
+    assert geojson_utils.get_quantized_precision([0, 0, 1000, 500], 10**6) == 3
+    assert geojson_utils.get_quantized_precision([0, 0, 10**7, 10], 10**6) == 0
+    assert geojson_utils.get_quantized_precision([0, 0, 0, 0], 10**6) == 0
+
+
+def test_quantize_round_trip_error():
+    rng = np.random.default_rng(0)
+    features = []
+    for _ in range(20):
+        # Random star-shaped polygon so it is always valid
+        center = rng.uniform(0, 1000, 2)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 30))
+        radii = rng.uniform(1, 10, 30)
+        ring = np.column_stack(
+            [center[0] + radii * np.cos(angles), center[1] + radii * np.sin(angles)]
+        ).tolist()
+        ring.append(ring[0])
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        )
+
+    quantization = 10**5
+    carto_json = CartoJson({"type": "FeatureCollection", "features": features})
+    carto_json.postprocess()
+    quantized = json.loads(json.dumps(carto_json.quantize(quantization)))
+
+    bbox = carto_json.geoms_info["bbox"]
+    step = 10 ** -geojson_utils.get_quantized_precision(bbox, quantization)
+    assert step <= max(bbox[2] - bbox[0], bbox[3] - bbox[1]) / quantization
+
+    max_error = 0
+    for original, rounded in zip(features, quantized["features"]):
+        diff = np.abs(
+            np.asarray(original["geometry"]["coordinates"][0])
+            - np.asarray(rounded["geometry"]["coordinates"][0])
+        )
+        max_error = max(max_error, diff.max())
+
+    assert max_error <= step / 2 + 1e-9
+    assert max_error > 0
+
+    # The original data is unchanged
+    assert carto_json.json_data["features"][0] is features[0]
+
+
+def test_polygons_ragged_array_round_trip():
+    geometries = [
+        {
+            "type": "Polygon",
+            "coordinates": [
+                [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+                [[1, 1], [1, 2], [2, 2], [2, 1], [1, 1]],
+            ],
+        },
+        {
+            "type": "MultiPolygon",
+            "coordinates": [
+                [[[5, 0], [6, 0], [6, 1], [5, 0]]],
+                [[[7, 0], [8, 0], [8, 1], [7, 0]]],
+            ],
+        },
+    ]
+
+    coordinates, offsets = geojson_utils.polygons_to_ragged_array(geometries)
+    assert coordinates.shape == (18, 2)
+
+    result = geojson_utils.polygons_from_ragged_array(
+        coordinates, offsets, ["Polygon", "MultiPolygon"]
+    )
+    assert result == geometries
+
+    info = geojson_utils.get_geoms_info(
+        shapely.from_ragged_array(
+            shapely.GeometryType.MULTIPOLYGON, coordinates, offsets
+        )
+    )
+    assert info["bbox"] == [0, 0, 8, 4]
+    assert info["area"] == 16
+
+
+def test_read_collection_members_skips_features(tmp_path):
+    collection = {
+        "type": "FeatureCollection",
+        "name": 'quoted "features": [ ] \\',
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"s": '\\"[[{', "features": "]]}}"},
+                "geometry": None,
+            }
+        ],
+        "bbox": [0, 0, 1, 1],
+    }
+    filepath = tmp_path / "collection.json"
+    filepath.write_text(json.dumps(collection))
+    expected = {key: value for key, value in collection.items() if key != "features"}
+
+    # Small chunks split strings, escapes and brackets across chunk boundaries
+    for chunk_size in [1, 2, 3, 7, 1 << 22]:
+        members = geojson_utils.read_collection_members(filepath, chunk_size=chunk_size)
+        assert members == expected
+
+
+def test_read_collection_members_encodings(tmp_path):
+    filepath = tmp_path / "collection.json"
+    for encoding in ["utf-8", "utf-8-sig", "utf-16", "latin-1"]:
+        filepath.write_text(
+            json.dumps({"name": "Réunion", "features": []}, ensure_ascii=False),
+            encoding=encoding,
+        )
+        assert geojson_utils.read_collection_members(filepath) == {"name": "Réunion"}
+
+
+@pytest.mark.parametrize(
+    "ring",
+    [
+        [[0, 0, 1], [1, 0, 1], [1, 1, 2], [0, 0, 1]],
+        [[0, 0, 1], [1, 0], [1, 1, 2], [0, 0]],
+    ],
+)
+def test_ragged_array_needs_2d_positions(ring):
+    geometry = {"type": "Polygon", "coordinates": [ring]}
+    assert geojson_utils.polygons_to_ragged_array([geometry]) is None
+
+
+def test_polygons_with_z_coordinates():
+    geometry = {
+        "type": "Polygon",
+        "coordinates": [[[0, 0, 1], [1, 0, 1], [1, 1, 2], [0, 0, 1]]],
+    }
+
+    # The geometries are created one by one instead
+    carto_json = CartoJson(
+        {
+            "type": "FeatureCollection",
+            "features": [{"type": "Feature", "properties": {}, "geometry": geometry}],
+        }
+    )
+    carto_json.postprocess(target_area=2, target_centroid={"x": 0, "y": 0})
+
+    assert shapely.area(carto_json.geometries).sum() == pytest.approx(2)
@@ -0,0 +1,116 @@
+import json
+
+import jobs
+import pytest
+from utils import file_utils
+
+
+class FakeRedis:
+    def __init__(self):
+        self.delayed = {}
+        self.started = {}
+        self.queue = []
+        self.processing = []
+        self.values = {}
+
+    def _zset(self, key):
+        return self.delayed if key == jobs.DELAYED_KEY else self.started
+
+    def zadd(self, key, mapping, nx=False):
+        zset = self._zset(key)
+        for member, score in mapping.items():
+            if not nx or member not in zset:
+                zset[member] = score
+
+    def zrangebyscore(self, key, low, high):
+        return [member for member, score in self._zset(key).items() if score <= high]
+
+    def zscore(self, key, member):
+        return self._zset(key).get(member)
+
+    def zrem(self, key, member):
+        return int(self._zset(key).pop(member, None) is not None)
+
+    def lpush(self, key, value):
+        self.queue.insert(0, value)
+
+    def lrange(self, key, start, end):
+        return list(self.processing)
+
+    def lrem(self, key, count, value):
+        if value not in self.processing:
+            return 0
+        self.processing.remove(value)
+        return 1
+
+    def blmove(self, source, destination, timeout, src, dest):
+        if not self.queue:
+            return None
+        value = self.queue.pop(0)
+        self.processing.append(value)
+        return value
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+
+def test_requeue_due_moves_only_due_jobs(mocker):
+    mocker.patch("time.time", return_value=100)
+    redis_conn = FakeRedis()
+    redis_conn.zadd(jobs.DELAYED_KEY, {"due": 99, "later": 130})
+
+    jobs.requeue_due(redis_conn)
+
+    assert redis_conn.queue == ["due"]
+    assert redis_conn.delayed == {"later": 130}
+
+
+def test_requeue_due_moves_lost_jobs(mocker):
+    mocker.patch("settings.CARTOGRAM_JOB_LEASE", 60)
+    mocker.patch("time.time", return_value=100)
+    redis_conn = FakeRedis()
+    redis_conn.processing = ["lost", "running", "unrecorded"]
+    redis_conn.zadd(jobs.STARTED_KEY, {"lost": 10, "running": 90})
+
+    jobs.requeue_due(redis_conn)
+
+    assert redis_conn.queue == ["lost"]
+    assert redis_conn.processing == ["running", "unrecorded"]
+    assert redis_conn.started == {"running": 90, "unrecorded": 100}
+
+
+def test_finished_job_leaves_processing_list(mocker):
+    redis_conn = FakeRedis()
+    mocker.patch("redis_pool.get_connection", return_value=redis_conn)
+    mocker.patch("jobs.requeue_due")
+    mocker.patch("jobs.generate", return_value={"mapDBKey": None, "warnings": []})
+    redis_conn.set(jobs.JOB_KEY.format("abc"), '{"status": "queued", "data": {}}')
+    redis_conn.queue = [b"abc"]
+
+    # Stop the worker once the queue is empty
+    blmove = redis_conn.blmove
+    mocker.patch.object(
+        redis_conn,
+        "blmove",
+        side_effect=lambda *args: blmove(*args) if redis_conn.queue else 1 / 0,
+    )
+    with pytest.raises(ZeroDivisionError):
+        jobs.work(mocker.Mock())
+
+    job = json.loads(redis_conn.get(jobs.JOB_KEY.format("abc")))
+    assert job == {"status": "done", "result": {"mapDBKey": None, "warnings": []}}
+    assert redis_conn.processing == []
+    assert redis_conn.started == {}
+
+
+def test_source_path_is_found_by_edited_key():
+    data = {"editedKey": "abc", "editedFrom": "static/cartdata/world/Input.json"}
+
+    assert jobs.get_source_path(data, data["editedFrom"]) == (
+        file_utils.get_safepath("static/userdata", "abc")
+    )
+    assert jobs.get_source_path({}, "/tmp/abc/Input.json") == "tmp/abc"
+    assert jobs.get_source_path({}, None) is None
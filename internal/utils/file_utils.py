@@ -1,8 +1,18 @@
+import gzip
 import os
 import re
+import shutil
 
 from errors import CartoError
 
+try:
+    import brotli
+except ImportError:  # Brotli is optional, only gzip copies are written without it
+    brotli = None
+
+#: File suffix of the precompressed copies for each Content-Encoding
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
 
 def sanitize_filename(filename):
     if filename is None:
@@ -37,3 +47,83 @@ def get_safepath(*parts):
         raise CartoError(f"Invalid file path: {fullpath}.")
 
     return fullpath
+
+
+def save_compressed(filepath, data=None, best=False):
+    """
+    Write precompressed copies (.gz, and .br if Brotli is installed) next to a file,
+    so they can be served with the matching Content-Encoding.
+
+    Args:
+        filepath: Path to the original file
+        data: Content of the original file as bytes. Read from the file if not given.
+        best: Whether to compress as much as possible, which is much slower. Files
+            written during generation use fast settings, built-in maps are compressed
+            at build time with the best settings.
+    """
+    filepath = get_safepath(filepath)
+    if data is None:
+        with open(filepath, "rb") as f:
+            data = f.read()
+
+    write_atomic(
+        filepath + COMPRESSED_SUFFIXES["gzip"],
+        gzip.compress(data, compresslevel=9 if best else 4, mtime=0),
+    )
+
+    if brotli is not None:
+        write_atomic(
+            filepath + COMPRESSED_SUFFIXES["br"],
+            brotli.compress(data, quality=11 if best else 4),
+        )
+
+
+def write_atomic(filepath, data):
+    """
+    Write a file by replacing it with a fully written temporary file, so readers never
+    see a partial file and a hard-linked file is replaced instead of modified.
+
+    Args:
+        filepath: Path to the file
+        data: Content of the file as bytes
+    """
+    filepath = get_safepath(filepath)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def link_or_copy(source, destination, compressed=False):
+    """
+    Hard link a file to a new path, or copy it if it cannot be linked (e.g. across
+    file systems). An existing file at the destination is replaced.
+
+    Args:
+        source: Path to the existing file
+        destination: Path to the new file
+        compressed: Whether to also link the precompressed copies of the file, which
+            are written if the source has none
+    """
+    source = get_safepath(source)
+    destination = get_safepath(destination)
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+    if compressed:
+        suffixes = COMPRESSED_SUFFIXES.values()
+        if all(os.path.exists(source + suffix) for suffix in suffixes):
+            for suffix in suffixes:
+                link_or_copy(source + suffix, destination + suffix)
+        else:
+            save_compressed(destination)
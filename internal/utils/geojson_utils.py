@@ -1,24 +1,113 @@
+import json
+import math
+import mmap
+import re
+from itertools import pairwise
+
+import numpy as np
+import shapely
+
+
 def get_geoms_info(geometries):
     """
     Get bounding box, centriod, and total area of geojson.
     Alternative to using geopandas. Useful when working with projected map without writing to a file.
     """
 
-    xs = []
-    ys = []
-    area = 0
-    for geom in geometries:
-        minx, miny, maxx, maxy = geom.bounds
-        xs.extend([minx, maxx])
-        ys.extend([miny, maxy])
-
-        area += geom.area
+    bounds = shapely.bounds(geometries)
+    bbox = [
+        float(np.nanmin(bounds[:, 0])),
+        float(np.nanmin(bounds[:, 1])),
+        float(np.nanmax(bounds[:, 2])),
+        float(np.nanmax(bounds[:, 3])),
+    ]
+    area = float(shapely.area(geometries).sum())
 
-    bbox = [min(xs), min(ys), max(xs), max(ys)]
     centroid = {"x": (bbox[2] + bbox[0]) / 2, "y": (bbox[3] + bbox[1]) / 2}
     return {"bbox": bbox, "centroid": centroid, "area": area}
 
 
+def polygons_to_ragged_array(geometries):
+    """
+    Collect the coordinates of GeoJSON Polygon and MultiPolygon geometries into one
+    buffer, in the ragged array layout of shapely.from_ragged_array.
+
+    Geometries can then be created from the buffer in a single call, which is much
+    faster than creating them one by one. Polygons are treated as MultiPolygons with
+    one part.
+
+    Args:
+        geometries (list): GeoJSON Polygon or MultiPolygon geometries.
+
+    Returns:
+        tuple: Coordinates (an N x 2 array), and offsets of rings, parts, and
+            geometries, or None if any position does not have exactly two values
+            (e.g., with Z coordinates).
+    """
+    ring_lengths = []
+    part_lengths = []
+    geometry_lengths = []
+    coordinates = []
+    for geometry in geometries:
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        else:
+            polygons = geometry["coordinates"]
+
+        geometry_lengths.append(len(polygons))
+        for polygon in polygons:
+            part_lengths.append(len(polygon))
+            for ring in polygon:
+                ring_lengths.append(len(ring))
+                coordinates.extend(ring)
+
+    try:
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    except ValueError:
+        # Positions of different lengths
+        return None
+    if len(coordinates) != sum(ring_lengths):
+        # Positions of the same length other than 2
+        return None
+
+    offsets = tuple(
+        np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        for lengths in (ring_lengths, part_lengths, geometry_lengths)
+    )
+    return coordinates, offsets
+
+
+def polygons_from_ragged_array(coordinates, offsets, geometry_types):
+    """
+    Create GeoJSON geometries from a coordinate buffer. Reverse of
+    polygons_to_ragged_array.
+
+    Args:
+        coordinates (numpy.ndarray): Coordinates (an N x 2 array).
+        offsets (tuple): Offsets of rings, parts, and geometries.
+        geometry_types (list): GeoJSON type ("Polygon" or "MultiPolygon") of each
+            geometry.
+
+    Returns:
+        list: GeoJSON geometries.
+    """
+    coordinates = coordinates.tolist()
+    ring_offsets, part_offsets, geometry_offsets = (
+        offset.tolist() for offset in offsets
+    )
+    rings = [coordinates[start:end] for start, end in pairwise(ring_offsets)]
+    parts = [rings[start:end] for start, end in pairwise(part_offsets)]
+
+    result = []
+    for index, (start, end) in enumerate(pairwise(geometry_offsets)):
+        if geometry_types[index] == "Polygon":
+            result.append({"type": "Polygon", "coordinates": parts[start]})
+        else:
+            result.append({"type": "MultiPolygon", "coordinates": parts[start:end]})
+
+    return result
+
+
 def union_bounding_boxes(bbox1, bbox2):
     """
     Calculates the union of two bounding boxes.
@@ -38,3 +127,268 @@ def union_bounding_boxes(bbox1, bbox2):
     new_x_max = max(x1_max, x2_max)
     new_y_max = max(y1_max, y2_max)
     return [new_x_min, new_y_min, new_x_max, new_y_max]
+
+
+def get_quantized_precision(bbox, quantization):
+    """
+    Get the number of decimal places that keeps coordinates on a grid of at least
+    `quantization` steps across the larger side of the bounding box.
+
+    Args:
+        bbox (list): The bounding box in the format [x_min, y_min, x_max, y_max].
+        quantization (int): Minimum number of grid steps across the map extent.
+
+    Returns:
+        int: Number of decimal places (at least 0).
+    """
+    extent = max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+    if extent <= 0:
+        return 0
+
+    return max(0, math.ceil(math.log10(quantization / extent)))
+
+
+def round_geometry(geometry, ndigits):
+    """
+    Round the coordinates of a GeoJSON geometry.
+
+    Args:
+        geometry (dict): GeoJSON geometry.
+        ndigits (int): Number of decimal places to keep.
+
+    Returns:
+        dict: A new GeoJSON geometry with rounded coordinates.
+    """
+    if geometry is None:
+        return None
+
+    if geometry.get("type") == "GeometryCollection":
+        return {
+            **geometry,
+            "geometries": [
+                round_geometry(geom, ndigits) for geom in geometry["geometries"]
+            ],
+        }
+
+    return {
+        **geometry,
+        "coordinates": _round_coordinates(geometry["coordinates"], ndigits),
+    }
+
+
+def _round_coordinates(coordinates, ndigits):
+    if len(coordinates) == 0:
+        return coordinates
+
+    # A single position
+    if isinstance(coordinates[0], (int, float)):
+        return [round(value, ndigits) for value in coordinates]
+
+    # A list of positions, e.g., a ring or a line
+    if isinstance(coordinates[0][0], (int, float)):
+        return np.round(np.asarray(coordinates, dtype=float), ndigits).tolist()
+
+    return [_round_coordinates(part, ndigits) for part in coordinates]
+
+
+#: Byte order marks and the encodings they identify
+_BYTE_ORDER_MARKS = [
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe", "utf-16"),
+    (b"\xfe\xff", "utf-16"),
+]
+
+#: Separator between the name and the value of a member
+_MEMBER_SEPARATOR = re.compile(rb"\s*:\s*")
+
+
+def read_collection_members(filepath, skip="features", chunk_size=1 << 22):
+    """
+    Read the top-level members of a GeoJSON file, except one (the features) that is
+    skipped without being parsed.
+
+    The file is scanned in chunks for the brackets and quotes that delimit the skipped
+    member, so large feature collections are not loaded into memory. UTF-8 and other
+    ASCII-compatible encodings are scanned; UTF-16 files are parsed as a whole.
+
+    Args:
+        filepath: Path to the GeoJSON file
+        skip: Name of the top-level member to skip
+        chunk_size: Number of bytes scanned at a time
+
+    Returns:
+        dict: The top-level members, or an empty dict if the file is not a JSON object
+
+    Raises:
+        ValueError: If the file is not valid JSON
+    """
+    with open(filepath, "rb") as f:
+        prefix = f.read(4)
+        encoding = _sniff_encoding(prefix)
+
+        if encoding.startswith("utf-16") or not prefix:
+            f.seek(0)
+            data = json.loads(f.read().decode(encoding)) if prefix else None
+            if not isinstance(data, dict):
+                return {}
+            return {key: value for key, value in data.items() if key != skip}
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            span = _find_member_value(buffer, skip, chunk_size)
+            if span is None:
+                text = buffer[:]
+            else:
+                # Replace the skipped value by null, so the rest is valid JSON
+                text = buffer[: span[0]] + b"null" + buffer[span[1] :]
+
+    try:
+        data = json.loads(text.decode(encoding))
+    except UnicodeDecodeError:
+        data = json.loads(text.decode("latin-1"))
+
+    if not isinstance(data, dict):
+        return {}
+
+    return {key: value for key, value in data.items() if key != skip}
+
+
+def _sniff_encoding(prefix):
+    for mark, encoding in _BYTE_ORDER_MARKS:
+        if prefix.startswith(mark):
+            return encoding
+
+    # JSON text starts with an ASCII character, so UTF-16 has a null byte next to it
+    if len(prefix) >= 2 and (prefix[0] == 0 or prefix[1] == 0):
+        return "utf-16-be" if prefix[0] == 0 else "utf-16-le"
+
+    return "utf-8"
+
+
+def _find_member_value(buffer, name, chunk_size):
+    """Find the byte span of the value of a top-level member, or None if not found."""
+    key = json.dumps(name).encode()
+    scanner = _JsonScanner(buffer, chunk_size)
+
+    start = buffer.find(key)
+    while start >= 0:
+        scanner.advance(start)
+        if scanner.depth == 1 and not scanner.in_string:
+            match = _MEMBER_SEPARATOR.match(buffer, start + len(key))
+            if match:
+                value_start = match.end()
+                if buffer[value_start : value_start + 1] not in (b"[", b"{"):
+                    # A scalar value is small enough to be parsed with the rest
+                    return None
+
+                scanner.advance(value_start)
+                value_end = scanner.find_depth(1, from_position=value_start + 1)
+                return (value_start, value_end) if value_end is not None else None
+
+        start = buffer.find(key, start + 1)
+
+    return None
+
+
+class _JsonScanner:
+    """
+    Track the nesting depth of JSON text, skipping brackets inside strings.
+
+    The state (depth, whether inside a string, and whether the next byte is escaped)
+    is kept between calls, so the text is scanned once from start to end.
+    """
+
+    def __init__(self, buffer, chunk_size):
+        self.buffer = buffer
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def advance(self, stop):
+        """Scan up to (not including) a position."""
+        while self.position < stop:
+            self._scan(min(stop, self.position + self.chunk_size))
+
+    def find_depth(self, depth, from_position):
+        """Scan until a closing bracket returns to a depth, return the position after it."""
+        self.advance(from_position)
+        while self.position < len(self.buffer):
+            end = self._scan(
+                min(len(self.buffer), self.position + self.chunk_size), depth
+            )
+            if end is not None:
+                return end
+
+        return None
+
+    def _scan(self, stop, target_depth=None):
+        chunk = np.frombuffer(
+            self.buffer,
+            dtype=np.uint8,
+            count=stop - self.position,
+            offset=self.position,
+        )
+        quotes = np.flatnonzero(chunk == ord('"'))
+
+        backslashes = np.flatnonzero(chunk == ord("\\"))
+        escaped_out = False
+        if len(backslashes) or self.escaped:
+            escaped, escaped_out = self._get_escaped(backslashes, len(chunk))
+            if escaped:
+                quotes = quotes[~np.isin(quotes, list(escaped))]
+
+        brackets = np.flatnonzero(
+            (chunk == ord("["))
+            | (chunk == ord("]"))
+            | (chunk == ord("{"))
+            | (chunk == ord("}"))
+        )
+        # A bracket is outside strings if an even number of quotes precede it
+        quotes_before = np.searchsorted(quotes, brackets) + int(self.in_string)
+        brackets = brackets[quotes_before % 2 == 0]
+        opening = (chunk[brackets] == ord("[")) | (chunk[brackets] == ord("{"))
+        depths = self.depth + np.cumsum(np.where(opening, 1, -1))
+
+        if target_depth is not None:
+            hits = np.flatnonzero((depths == target_depth) & ~opening)
+            if len(hits):
+                end = self.position + int(brackets[hits[0]]) + 1
+                self.position = end
+                self.depth = target_depth
+                self.in_string = False
+                self.escaped = False
+                return end
+
+        if len(depths):
+            self.depth = int(depths[-1])
+        self.in_string ^= len(quotes) % 2 == 1
+        self.escaped = escaped_out
+        self.position = stop
+        return None
+
+    def _get_escaped(self, backslashes, length):
+        """Get the positions escaped by a backslash, and if the next chunk starts escaped."""
+        escaped = set()
+        if self.escaped and (not len(backslashes) or backslashes[0] != 0):
+            escaped.add(0)
+
+        escaped_out = False
+        # Runs of consecutive backslashes; an odd run escapes the byte after it
+        breaks = np.flatnonzero(np.diff(backslashes) != 1) + 1
+        for run in np.split(backslashes, breaks):
+            if not len(run):
+                continue
+
+            run_length = len(run)
+            if run[0] == 0 and self.escaped:
+                # The first backslash is escaped by the end of the previous chunk
+                run_length -= 1
+
+            if run_length % 2 == 1:
+                if run[-1] + 1 < length:
+                    escaped.add(int(run[-1]) + 1)
+                else:
+                    escaped_out = True
+
+        return escaped, escaped_out
@@ -0,0 +1,27 @@
+import geopandas as gpd
+import pyogrio
+
+try:
+    import pyarrow
+except ImportError:  # pyarrow is optional, features are then read without Arrow
+    pyarrow = None
+
+
+def read_dataframe(filepath, columns=None) -> gpd.GeoDataFrame:
+    """
+    Read a vector file (GeoJSON, Shapefile, GeoPackage, ...) into a GeoDataFrame with
+    pyogrio, using its columnar Arrow interface if pyarrow is installed.
+
+    Args:
+        filepath: Path to the file
+        columns: Names of the attribute columns to read, or None to read all of them.
+            Names that are not in the file are ignored.
+
+    Returns:
+        gpd.GeoDataFrame: The features and their geometries
+    """
+    return pyogrio.read_dataframe(
+        filepath,
+        columns=list(columns) if columns is not None else None,
+        use_arrow=pyarrow is not None,
+    )
@@ -0,0 +1,47 @@
+import os
+
+from flask import current_app, request, send_from_directory
+from utils import file_utils
+
+
+def send_static_file(filename):
+    """
+    Serve a static file, using its precompressed copy if the client accepts it.
+
+    Replaces Flask's default static view. GeoJSON files may have .br and .gz copies
+    written next to them (see file_utils.save_compressed); the best one accepted by
+    the client is sent with Content-Encoding. Copies older than the original file are
+    ignored, so a stale copy is never served.
+    """
+    static_folder = current_app.static_folder
+
+    if filename.endswith(".json") and static_folder:
+        original_path = os.path.join(static_folder, filename)
+
+        for encoding, suffix in file_utils.COMPRESSED_SUFFIXES.items():
+            if not request.accept_encodings[encoding]:
+                continue
+
+            compressed_path = original_path + suffix
+            try:
+                if os.path.getmtime(compressed_path) < os.path.getmtime(original_path):
+                    continue
+            except OSError:
+                continue
+
+            # The ETag is computed from the compressed file, so each encoding has its own
+            response = send_from_directory(
+                static_folder,
+                filename + suffix,
+                mimetype="application/json",
+                max_age=current_app.get_send_file_max_age(filename),
+            )
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+
+    response = current_app.send_static_file(filename)
+    if filename.endswith(".json"):
+        response.vary.add("Accept-Encoding")
+
+    return response
@@ -45,6 +45,10 @@ def create_app():
     from routes.cartogram_routes import cartogram_bp
     from routes.main_routes import main_bp
     from routes.maintenance_routes import maintenance_bp
+    from views import static_files
+
+    # Serve precompressed copies of static GeoJSON files when possible
+    app.view_functions["static"] = static_files.send_static_file
 
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
@@ -18,6 +18,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "../internal/executable"
 from carto import boundary, project
 from carto.dataframe import CartoDataFrame
 from handler_metadata import cartogram_handlers  # type: ignore
+from utils import file_utils
 
 CARTDATA_PATH = os.path.join(os.path.dirname(__file__), "../internal/static/cartdata")
 KEY_COL = 0
@@ -78,6 +79,17 @@ parser_gen_map.add_argument(
     "Use 'all' to regenerate cartograms for all folders in cartdata.",
 )
 
+parser_compress = subparsers.add_parser(
+    "compress",
+    help="write precompressed (.gz and .br) copies of the GeoJSON files of the specified map "
+    "in internal/static/cartdata folder, so they can be served with Content-Encoding.",
+)
+parser_compress.add_argument(
+    "map_folder",
+    help="the name of a folder in cartdata (e.g., usa). "
+    "Use 'all' to compress the files of all folders in cartdata.",
+)
+
 
 def read_csv_with_encoding(file_path: str) -> pd.DataFrame | None:
     """
@@ -411,7 +423,11 @@ def gen_map(handler_str: str, vis_types_str: str | None = None) -> dict[str, str
     else:
         vis_types = {}
 
-    input_cdf = CartoDataFrame.read_file(handler / "Input.json")
+    input_cdf = CartoDataFrame.read_file(
+        handler / "Input.json",
+        columns={first_col, "Region", "ColorGroup", "Geographic Area (sq. km)"},
+        trusted=True,
+    )
     if first_col == "Region":
         data_df = data_df.merge(
             input_cdf[["Region", "ColorGroup", "Geographic Area (sq. km)"]],
@@ -455,6 +471,20 @@ def gen_map(handler_str: str, vis_types_str: str | None = None) -> dict[str, str
     return vis_types
 
 
+def compress_map(handler: str) -> None:
+    """
+    Write precompressed copies of the GeoJSON files of a handler, or of all handlers if 'all' is specified.
+
+    Args:
+        handler (str): The handler
+    """
+    handler_names = cartogram_handlers if handler == "all" else [handler]
+    for handler_name in handler_names:
+        print(f"Compress files of {handler_name}...")
+        for json_file in Path(f"{CARTDATA_PATH}/{handler_name}").glob("*.json"):
+            file_utils.save_compressed(str(json_file.resolve()), best=True)
+
+
 def modify_handler(
     map_name: str,
     user_friendly_name: str,
@@ -541,6 +571,7 @@ parser_add_map.set_defaults(
 parser_gen_map.set_defaults(
     func=lambda args: gen_map_wrapper(args.map_folder, vis_types_str=args.vis_types)
 )
+parser_compress.set_defaults(func=lambda args: compress_map(args.map_folder))
 
 args = parser.parse_args()
 
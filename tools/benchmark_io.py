@@ -0,0 +1,148 @@
+# Script to compare the ways boundary files can be read
+# Run from the repository root: python tools/benchmark_io.py
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import time
+
+import geopandas as gpd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../internal"))
+
+import settings
+from carto.dataframe import CartoDataFrame
+from utils import file_utils, io_utils
+
+TEST_FILE = os.path.join(
+    os.path.dirname(__file__), "../test-data/usa_by_state_since_1959.geojson"
+)
+SYNTHETIC_FILE = os.path.join(
+    os.path.dirname(__file__), "../internal/tmp/benchmark_io/synthetic.geojson"
+)
+# The validity of a file read before is cached, so the cache is kept apart
+CACHE_DIR = os.path.join(
+    os.path.dirname(__file__), "../internal/tmp/benchmark_io/cache"
+)
+
+parser = argparse.ArgumentParser(
+    description="Benchmark reading boundary files with different engines."
+)
+parser.add_argument(
+    "--size",
+    type=int,
+    default=100,
+    help="number of regions per side of the synthetic grid (default: 100)",
+)
+parser.add_argument(
+    "--vertices",
+    type=int,
+    default=40,
+    help="number of vertices of each synthetic region (default: 40)",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=3,
+    help="number of runs of each reader, the fastest is reported (default: 3)",
+)
+
+
+def write_synthetic_file(path, size, vertices):
+    """Write a grid of round regions with a few attribute columns."""
+    features = []
+    for i in range(size):
+        for j in range(size):
+            ring = [
+                [
+                    i + 0.5 + 0.49 * math.cos(2 * math.pi * k / vertices),
+                    j + 0.5 + 0.49 * math.sin(2 * math.pi * k / vertices),
+                ]
+                for k in range(vertices)
+            ]
+            ring.append(ring[0])
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "Region": f"R{i}_{j}",
+                        "Population": i * j,
+                        "Name": f"Region {i} {j}",
+                        "Note": None if j % 7 == 0 else "note",
+                    },
+                    "geometry": {"type": "Polygon", "coordinates": [ring]},
+                }
+            )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def read_previous(path):
+    """Read like CartoDataFrame.read_file before the I/O layer."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    extra_attributes = {key: value for key, value in data.items() if key != "features"}
+    gdf = gpd.read_file(path)
+    gdf.is_simple.all()
+    return gdf, extra_attributes
+
+
+def clear_cache():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def measure(reader, path, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        reader(path)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    print(f"Arrow: {'enabled' if io_utils.pyarrow is not None else 'not installed'}")
+
+    write_synthetic_file(SYNTHETIC_FILE, args.size, args.vertices)
+    settings.CARTOGRAM_CACHE_DIR = CACHE_DIR
+
+    readers = {
+        "previous read_file": read_previous,
+        "geopandas.read_file": gpd.read_file,
+        "io_utils.read_dataframe": io_utils.read_dataframe,
+        "io_utils.read_dataframe (Region)": lambda path: io_utils.read_dataframe(
+            path, columns=["Region"]
+        ),
+    }
+    # A new upload is read cold, checking its geometries; a file read before is warm
+    cached_readers = {
+        "CartoDataFrame.read_file (cold)": clear_cache,
+        "CartoDataFrame.read_file (warm)": None,
+    }
+
+    for path in [TEST_FILE, SYNTHETIC_FILE]:
+        path = file_utils.get_safepath(path)
+        size = os.path.getsize(path) / 10**6
+        print(f"\n{os.path.basename(path)} ({size:.1f} MB)")
+
+        for name, reader in readers.items():
+            seconds = measure(reader, path, args.repeat)
+            print(f"  {name:<36} {seconds:8.3f}s")
+
+        # The cold runs leave the cache filled for the warm runs
+        for name, setup in cached_readers.items():
+            seconds = measure(CartoDataFrame.read_file, path, args.repeat, setup)
+            print(f"  {name:<36} {seconds:8.3f}s")
+
+    clear_cache()
+    os.remove(SYNTHETIC_FILE)
@@ -18,6 +18,9 @@ echo "Migrations completed!"
 if [ "$1" = "production" ]; then
   echo "Running in production mode: starting Gunicorn/Cron..."
   exec sh -c "cron & gunicorn --bind $CARTOGRAM_HOST:$CARTOGRAM_PORT -w $CARTOGRAM_GUNICORN_WORKERS $CARTOGRAM_GUNICORN_OPTIONS \"web:create_app()\""
+elif [ "$1" = "worker" ]; then
+  echo "Running job workers for asynchronous cartogram generation..."
+  exec python3 jobs.py
 elif [ "$1" = "development" ]; then
   echo "Running in development mode: sleeping indefinitely..."
   exec sleep infinity